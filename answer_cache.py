@@ -0,0 +1,113 @@
+"""
+In-memory LRU cache of WITNESS answers, so repeated questions about the same keyword skip OpenAI.
+"""
+
+import os
+import re
+import time
+from collections import OrderedDict
+
+# Maximum number of cached questions
+MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_SIZE", 1024))
+
+# Seconds before a cached answer expires
+TTL = int(os.getenv("ANSWER_CACHE_TTL", 3600))
+
+# Number of distinct answers kept per question. Above 1, cached answers are rotated for variety.
+VARIETY = int(os.getenv("ANSWER_CACHE_VARIETY", 1))
+
+def normalize_question(question):
+    '''
+    RETURNS the question lowercased, without punctuation and with single spaces
+    INPUT
+        question; string question
+    '''
+    return " ".join(re.sub(r"[^a-z0-9\s]", "", question.lower()).split())
+
+def make_key(keyword, question, n_words, banned_words):
+    '''
+    RETURNS the cache key for a WITNESS question
+    INPUT
+        keyword; string keyword
+        question; string question
+        n_words; target number of words for the answer
+        banned_words; list of string banned words
+    '''
+    return (keyword.lower(), normalize_question(question), n_words, frozenset(banned_words))
+
+class AnswerCache:
+    '''
+    LRU cache with time-to-live mapping question keys to one or more answers.
+    '''
+
+    max_entries = None  # Maximum number of cached keys
+    ttl = None          # Seconds before an entry expires
+    variety = None      # Number of answers kept per key before answers are reused
+    entries = None      # OrderedDict mapping each key to a list [created time, list of answers, index of next answer]
+    hits = None         # Number of lookups that returned a cached answer
+    misses = None       # Number of lookups that did not
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL, variety=VARIETY):
+        '''
+        Initializes this cache
+        INPUT
+            max_entries; maximum number of cached keys
+            ttl; seconds before an entry expires
+            variety; number of answers kept per key. Answers are reused only once this many have been cached.
+        '''
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.variety = max(1, variety)
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        '''
+        RETURNS a cached answer for the key, or None if the caller should fetch a new answer
+        INPUT
+            key; key from make_key()
+        '''
+        entry = self.entries.get(key)
+        if entry is not None and time.monotonic() - entry[0] > self.ttl:
+            del self.entries[key]
+            entry = None
+        if entry is None or len(entry[1]) < self.variety:
+            self.misses += 1
+            return None
+
+        # Rotate through the cached answers
+        self.entries.move_to_end(key)
+        answer = entry[1][entry[2]]
+        entry[2] = (entry[2] + 1) % len(entry[1])
+        self.hits += 1
+        return answer
+
+    def put(self, key, answer):
+        '''
+        Caches an answer for the key, evicting the least recently used keys past max_entries
+        INPUT
+            key; key from make_key()
+            answer; string answer
+        '''
+        entry = self.entries.get(key)
+        if entry is None:
+            self.entries[key] = [time.monotonic(), [answer], 0]
+        elif len(entry[1]) < self.variety:
+            entry[1].append(answer)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        '''
+        RETURNS dictionary of hit and miss counters
+        '''
+        total = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self.entries)}
+
+# Answer cache shared by all games
+ANSWER_CACHE = AnswerCache()
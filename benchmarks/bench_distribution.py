@@ -0,0 +1,43 @@
+"""
+Microbenchmark of dealing a WITNESS response among players: word_distribution.deal against the previous numpy path.
+
+    python benchmarks/bench_distribution.py --words 24 --players 12
+"""
+
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import word_distribution
+
+def numpy_deal(words, n_players):
+    '''
+    RETURNS the words shuffled and split among the players the way GameStateQuestion did before word_distribution
+    '''
+    import numpy as np
+    words = list(words)
+    random.shuffle(words)
+    return np.array_split(np.array(words), n_players)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--words", type=int, default=24)
+    parser.add_argument("--players", type=int, default=12)
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    words = [f"word{i}" for i in range(args.words)]
+    cases = {"word_distribution.deal": lambda: word_distribution.deal(words, args.players)}
+    try:
+        import numpy
+        cases["numpy array_split"] = lambda: numpy_deal(words, args.players)
+    except ImportError:
+        print("numpy is not installed; skipping the numpy path.")
+
+    for name, func in cases.items():
+        seconds = min(timeit.repeat(func, number=args.number, repeat=5))
+        print(f"{name}: {seconds / args.number * 1e6:.2f} us per deal")
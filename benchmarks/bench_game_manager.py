@@ -0,0 +1,85 @@
+"""
+Benchmarks GameManager with hundreds of concurrent games on fake Discord objects.
+Reports memory per game and message dispatch latency.
+
+    python benchmarks/bench_game_manager.py --games 500 --messages 20000
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import statistics
+import sys
+import tracemalloc
+from time import perf_counter
+
+# Run from the repository root, which holds the game modules and their data files
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import headless
+from gameplay import Game
+from game_registry import GameManager
+from headless import FakeGuild, FakeUser, FakeMessage
+
+async def run(n_games, n_guilds, players_per_game, n_messages):
+    manager = GameManager(max_per_guild=n_games, max_total=n_games)
+    guilds = [FakeGuild(f"guild{i}") for i in range(n_guilds)]
+
+    # Create games and measure their memory
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(n_games):
+            guild = guilds[i % n_guilds]
+            host = FakeUser(f"host{i}")
+            game = await Game.initialize(FakeMessage("$play", host, guild.lobby))
+            for j in range(players_per_game - 1):
+                await game.add_player(FakeUser(f"player{i}_{j}"))
+            manager.add(game)
+        await asyncio.sleep(0.01)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    memory = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+
+    # Dispatch messages from random players to their games
+    games = list(manager)
+    latencies = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(n_messages):
+            game = random.choice(games)
+            ply = random.choice(game.player_list)
+            message = FakeMessage(random.choice(["$showsettings", "hello everyone", "$showroles"]),
+                                  ply.user, ply.channel)
+            start = perf_counter()
+            routed = manager.for_channel(message.channel)
+            await routed.handle_message(message)
+            latencies.append(perf_counter() - start)
+        await asyncio.sleep(0.01)
+
+    latencies.sort()
+    print(f"games: {n_games} in {n_guilds} guilds, {players_per_game} players each")
+    print(f"memory per game: {memory / n_games / 1024:.1f} KiB")
+    print(f"dispatch p50: {statistics.median(latencies) * 1e6:.1f} us, "
+          f"p99: {latencies[int(len(latencies) * 0.99)] * 1e6:.1f} us, "
+          f"throughput: {len(latencies) / sum(latencies):.0f} msg/s")
+    print(f"metrics: {manager.metrics()}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--games", type=int, default=300)
+    parser.add_argument("--guilds", type=int, default=50)
+    parser.add_argument("--players", type=int, default=6)
+    parser.add_argument("--messages", type=int, default=10000)
+    args = parser.parse_args()
+
+    # Games build real banned words lists (from the cache or the fake OpenAI) and take snapshots, as in the bot
+    headless.install(stub_witness=False, snapshots=True)
+    try:
+        asyncio.run(run(args.games, args.guilds, args.players, args.messages))
+    finally:
+        headless.uninstall()
@@ -0,0 +1,50 @@
+"""
+Measures bot cold start time and resident memory with the compiled role registry,
+against the previous pandas-backed Role Summary.csv table.
+
+    python benchmarks/bench_roles.py --runs 5
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Code each measured interpreter runs before reporting its time and memory
+CASES = {"pandas table (before)": "import pandas as pd; pd.read_csv('Role Summary.csv', index_col='Title'); import gameplay",
+         "role registry (after)": "import gameplay"}
+
+PROBE = '''
+import resource, time
+start = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - start
+print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+'''
+
+def measure(code, runs):
+    '''
+    RETURNS tuple of median seconds and median peak resident KiB of running code in fresh interpreters
+    INPUT
+        code; string Python code to run
+        runs; number of interpreters to start
+    '''
+    times = []
+    memory = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", PROBE.format(code=code)],
+                             cwd=ROOT, capture_output=True, text=True, check=True).stdout.split()
+        times.append(float(out[-2]))
+        memory.append(int(out[-1]))
+    return statistics.median(times), statistics.median(memory)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    for name, code in CASES.items():
+        seconds, kib = measure(code, args.runs)
+        print(f"{name}: {seconds * 1000:.0f} ms, {kib / 1024:.1f} MiB peak RSS")
@@ -0,0 +1,66 @@
+"""
+Reports the import cost of the bot entry point per module, like python -X importtime,
+and fails when the cold start exceeds a time budget.
+
+    python benchmarks/bench_startup.py --budget-ms 800 --top 15
+
+benchmarks/test_startup.py checks the same budget under pytest.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Maximum median cold start of the bot entry point in milliseconds
+BUDGET_MS = float(os.getenv("WITNESS_STARTUP_BUDGET_MS", 800))
+
+# Heavy dependencies that must not be imported until first use
+DEFERRED_MODULES = ["numpy", "nltk", "pandas", "openai"]
+
+def import_times(module):
+    '''
+    RETURNS dictionary mapping each imported module name to a tuple of (self microseconds, cumulative microseconds)
+    INPUT
+        module; string name of the module to import in a fresh interpreter
+    '''
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=ROOT, capture_output=True, text=True, check=True).stderr
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--module", default="main", help="entry point module to import")
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS, help="maximum median cold start in milliseconds")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="number of slowest modules to list")
+    args = parser.parse_args()
+
+    runs = [import_times(args.module) for _ in range(args.runs)]
+    total_ms = statistics.median(times[args.module][1] for times in runs) / 1000
+
+    # List the slowest modules of the median run
+    times = sorted(runs, key=lambda t: t[args.module][1])[len(runs) // 2]
+    print(f"{'cumulative ms':>14} {'self ms':>8}  module")
+    for name, (self_us, cumulative_us) in sorted(times.items(), key=lambda item: -item[1][1])[:args.top]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>8.1f}  {name}")
+    print(f"\nimport {args.module}: {total_ms:.0f} ms median of {args.runs} runs, budget {args.budget_ms:.0f} ms")
+
+    failures = []
+    eager = [name for name in DEFERRED_MODULES if name in times]
+    if eager:
+        failures.append(f"deferred modules imported at startup: {', '.join(eager)}")
+    if total_ms > args.budget_ms:
+        failures.append(f"cold start {total_ms:.0f} ms is over the {args.budget_ms:.0f} ms budget")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,75 @@
+"""
+Benchmarks how game latency and throughput degrade as the upstream model slows down or fails.
+Plays headless games against fake_openai.py at increasing latencies, with optional injected faults.
+
+    python benchmarks/bench_upstream.py --latencies 0 0.2 0.5 1 --games 40 --rate-429 0.05
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+# Run from the repository root, which holds the game modules and their data files
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import headless
+import gameplay
+import gpt_responder
+from fake_openai import FakeOpenAI
+
+def format_seconds(value):
+    return "-" if value is None else f"{value * 1000:.0f}ms"
+
+async def run(args):
+    server = FakeOpenAI(rate_429=args.rate_429, rate_5xx=args.rate_5xx,
+                        rate_timeout=args.rate_timeout, hang=args.timeout + 1)
+    runner = await server.start(port=args.port)
+    os.environ["OPENAI_API_BASE"] = f"http://127.0.0.1:{args.port}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "local")
+    gpt_responder.REQUEST_TIMEOUT = args.timeout
+
+    results = []
+    try:
+        print("latency   games/s   failed   answered   start p50/p95     ask p50/p95")
+        for latency in args.latencies:
+            server.latency = lambda: latency
+            result = await headless.run(args.games, args.players, questions=args.questions,
+                                        concurrency=args.concurrency, n_guilds=args.guilds, seed=1)
+            result["upstream_latency"] = latency
+            results.append(result)
+            print(f"{latency:>6.2f}s {result['games_per_second']:>9.2f} {result['failed']:>8} "
+                  f"{result['questions_answered']:>10}   "
+                  f"{format_seconds(result['start_p50']):>7}/{format_seconds(result['start_p95']):<7}   "
+                  f"{format_seconds(result['ask_p50']):>7}/{format_seconds(result['ask_p95'])}")
+    finally:
+        await runner.cleanup()
+    print(f"fake OpenAI stats: {server.stats}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--latencies", type=float, nargs="+", default=[0, 0.2, 0.5, 1])
+    parser.add_argument("--games", type=int, default=40, help="games per latency")
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--questions", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=20, help="games played at once")
+    parser.add_argument("--guilds", type=int, default=5)
+    parser.add_argument("--rate-429", type=float, default=0)
+    parser.add_argument("--rate-5xx", type=float, default=0)
+    parser.add_argument("--rate-timeout", type=float, default=0)
+    parser.add_argument("--timeout", type=float, default=5, help="OpenAI request timeout in seconds")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output", help="path of a JSON file to write the results to")
+    args = parser.parse_args()
+
+    headless.install(stub_openai=False, stub_witness=False)
+    try:
+        asyncio.run(run(args))
+    finally:
+        headless.uninstall()
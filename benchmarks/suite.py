@@ -0,0 +1,239 @@
+"""
+Repeatable benchmark suite of the bot's hot paths. Writes the results to a JSON file, and compares them to an earlier run.
+
+    python benchmarks/suite.py --output before.json
+    python benchmarks/suite.py --output after.json --compare before.json
+
+Each benchmark reports the median and fastest time per operation over --repeat rounds.
+Comparisons use the fastest round, which is the least affected by other load on the machine.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+from time import perf_counter, time
+
+# Run from the repository root, which holds the game modules and their data files.
+# Paths given on the command line are relative to the directory the suite was started from.
+CWD = os.getcwd()
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import headless
+import gameplay
+import gamestates as gs
+import main
+import word_distribution
+import word_match
+from headless import Bot, FakeGuild, FakeMessage, FakeUser
+
+BENCHMARKS = {}     # Dictionary mapping each benchmark's name to its async setup function
+
+def benchmark(name, number):
+    '''
+    Registers a benchmark. The decorated async function sets it up and RETURNS the operation to time,
+    a function that takes no arguments and may return a coroutine to await. The operation is timed number times per round.
+    '''
+    def register(setup):
+        BENCHMARKS[name] = (setup, number)
+        return setup
+    return register
+
+async def measure(operation, number, repeat):
+    '''
+    RETURNS list of seconds per operation in each round
+    INPUT
+        operation; function taking no arguments, which may return a coroutine to await
+        number; number of operations per round
+        repeat; number of rounds
+    '''
+    rounds = []
+    first = operation()
+    is_async = asyncio.iscoroutine(first)
+    if is_async:
+        await first
+    for _ in range(repeat):
+        started = perf_counter()
+        if is_async:
+            for _ in range(number):
+                await operation()
+        else:
+            for _ in range(number):
+                operation()
+        rounds.append((perf_counter() - started) / number)
+
+        # Let the outboxes deliver the messages queued this round, outside the timed section
+        await asyncio.sleep(0.001)
+    return rounds
+
+async def new_game(n_players=6):
+    '''
+    RETURNS a headless Game in Creation with n_players players
+    '''
+    guild = FakeGuild()
+    users = [FakeUser(f"player{i}") for i in range(n_players)]
+    game = await gameplay.Game.initialize(FakeMessage("$play", users[0], guild.lobby))
+    for user in users[1:]:
+        await game.add_player(user)
+    return game
+
+@benchmark("route_ignored_message", number=20000)
+async def setup_route_ignored():
+    main.client._connection.user = FakeUser("Witness")
+    message = FakeMessage("just chatting", FakeUser("bystander"), FakeGuild().lobby)
+    return lambda: main.on_message(message)
+
+@benchmark("route_game_message", number=5000)
+async def setup_route_game():
+    main.client._connection.user = FakeUser("Witness")
+    game = await new_game()
+    main.games.add(game)
+    ply = game.player_list[1]
+    message = FakeMessage("what do you all think", ply.user, ply.channel)
+    return lambda: main.on_message(message)
+
+@benchmark("creation_commands", number=2000)
+async def setup_creation_commands():
+    game = await new_game()
+    host = game.player_list[0]
+    messages = itertools.cycle([FakeMessage(content, host.user, host.channel)
+                                for content in ["$role add villain", "$questiondur 200", "$role remove villain",
+                                                "$guessdur 90", "$role add nosuchrole", "$trialdur abc"]])
+    return lambda: game.handle_message(next(messages))
+
+@benchmark("make_prompt", number=20000)
+async def setup_make_prompt():
+    game = await new_game()
+    witness = await headless.StubWitness.initialize(game, "pumpkin pie", 6)
+    return lambda: witness.make_prompt("What would you find on a kitchen table in the autumn?")
+
+@benchmark("deal_words", number=20000)
+async def setup_deal_words():
+    words = [f"word{i}" for i in range(24)]
+    return lambda: word_distribution.deal(words, 6)
+
+@benchmark("match_guess", number=20000)
+async def setup_match_guess():
+    signature = word_match.match_signature("Pumpkin pies")
+    guesses = itertools.cycle(["pumpkin pie", "Pumpkins pie!", "apple pie", "pumpkin pies", "pumpkin patch"])
+    return lambda: word_match.matches(next(guesses), signature)
+
+@benchmark("tally_votes", number=20000)
+async def setup_tally_votes():
+    names = [f"player{i}" for i in range(12)]
+    rng = random.Random(1)
+    votes = {name: rng.choice(names) for name in names}
+    return lambda: gs.tally_votes(votes)
+
+@benchmark("full_game", number=50)
+async def setup_full_game():
+    guild = FakeGuild()
+    rng = random.Random(1)
+    async def play():
+        bot = Bot(guild, 6, rng)
+        await bot.play(roles=["villain", "detective"], questions=2)
+        await bot.close()
+    return play
+
+def git_commit():
+    '''
+    RETURNS the current git commit hash, or None outside a git checkout
+    '''
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def run(names, repeat, scale):
+    '''
+    RETURNS dictionary mapping each benchmark name to its results
+    INPUT
+        names; list of benchmark names to run
+        repeat; number of rounds per benchmark
+        scale; factor applied to each benchmark's number of operations per round
+    '''
+    headless.install()
+    try:
+        return await run_benchmarks(names, repeat, scale)
+    finally:
+        headless.uninstall()
+
+async def run_benchmarks(names, repeat, scale):
+    '''
+    RETURNS dictionary mapping each benchmark name to its results, with the game modules already set up by headless.install()
+    '''
+    results = {}
+    for name in names:
+        setup, number = BENCHMARKS[name]
+        number = max(1, int(number * scale))
+        operation = await setup()
+        await measure(operation, max(1, number // 10), 1)   # Warm up caches
+        rounds = await measure(operation, number, repeat)
+        median = statistics.median(rounds)
+        results[name] = {"us_per_op": median * 1e6,
+                         "ops_per_sec": 1 / median,
+                         "min_us_per_op": min(rounds) * 1e6,
+                         "number": number,
+                         "repeat": repeat}
+        print(f"{name:<24} {median * 1e6:>12.2f} us/op", file=sys.__stdout__)
+    return results
+
+def compare(results, baseline, threshold):
+    '''
+    Prints each benchmark's change against the baseline results
+    RETURNS list of the names of benchmarks that got slower by more than the threshold fraction
+    '''
+    regressions = []
+    print(f"\nCompared to {baseline.get('commit') or 'baseline'}:")
+    for name, result in results.items():
+        before = baseline["results"].get(name)
+        if before is None:
+            print(f"{name:<24} {'new':>12}")
+            continue
+        change = result["min_us_per_op"] / before["min_us_per_op"] - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<24} {change:>+11.1%}{flag}")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--output", default="benchmark-results.json", help="path of the JSON file to write the results to")
+    parser.add_argument("--compare", help="path of an earlier results JSON file to compare to")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="fractional slowdown reported as a regression; the exit code is 1 if any benchmark regressed")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="benchmarks to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=5, help="rounds per benchmark")
+    parser.add_argument("--scale", type=float, default=1, help="factor applied to the operations per round")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    with open(os.devnull, "w") as devnull:
+        sys.stdout = devnull    # The game prints progress to the terminal
+        results = asyncio.run(run(args.only or list(BENCHMARKS), args.repeat, args.scale))
+        sys.stdout = sys.__stdout__
+    report = {"commit": git_commit(),
+              "timestamp": time(),
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "results": results}
+    with open(os.path.join(CWD, args.output), "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+    if args.compare:
+        with open(os.path.join(CWD, args.compare)) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
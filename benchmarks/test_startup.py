@@ -0,0 +1,16 @@
+"""
+Fails when importing the bot entry point goes over the cold start budget, or imports a deferred dependency.
+
+    python -m pytest benchmarks/test_startup.py
+"""
+
+import statistics
+from bench_startup import BUDGET_MS, DEFERRED_MODULES, import_times
+
+def test_deferred_modules_not_imported():
+    times = import_times("main")
+    assert [name for name in DEFERRED_MODULES if name in times] == []
+
+def test_cold_start_within_budget():
+    total_ms = statistics.median(import_times("main")["main"][1] for _ in range(3)) / 1000
+    assert total_ms <= BUDGET_MS, f"import main took {total_ms:.0f} ms, over the {BUDGET_MS:.0f} ms budget"
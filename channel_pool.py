@@ -0,0 +1,121 @@
+"""
+ChannelPool reuses players' private Discord channels within a game's category,
+since creating channels is one of Discord's most rate-limited operations.
+A game keeps its category and players' channels across $restartgame rematches, so the pool only has to cover
+players leaving and joining. Channels are not shared between categories, and the pool ends with its game.
+"""
+
+import os
+from time import monotonic
+from scheduler import SCHEDULER
+
+# Maximum number of idle channels kept per category
+MAX_IDLE_CHANNELS = int(os.getenv("CHANNEL_POOL_SIZE", 6))
+
+# Seconds an idle channel is kept before it is deleted
+IDLE_TIMEOUT = int(os.getenv("CHANNEL_POOL_IDLE_TIMEOUT", 1800))
+
+class ChannelPool:
+    '''
+    Pool of idle private channels in one Discord category.
+    '''
+
+    category = None     # Discord category that holds the channels
+    max_idle = None     # Maximum number of idle channels kept
+    idle_timeout = None # Seconds an idle channel is kept before it is deleted
+    idle = None         # List of [channel, id of the user who last had it, monotonic() time it was released]
+    created = None      # Number of channels this pool created
+    reused = None       # Number of channels this pool handed out again
+    timer = None        # TimerHandle of the next eviction of idle channels, or None
+
+    def __init__(self, category, max_idle=MAX_IDLE_CHANNELS, idle_timeout=IDLE_TIMEOUT):
+        '''
+        Initializes an empty pool
+        INPUT
+            category; Discord category that holds the channels
+            max_idle; maximum number of idle channels kept
+            idle_timeout; seconds an idle channel is kept before it is deleted
+        '''
+        self.category = category
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.idle = []
+        self.created = 0
+        self.reused = 0
+        self.timer = None
+
+    async def acquire(self, user, overwrites):
+        '''
+        RETURNS a private channel for the user, reusing an idle channel if there is one
+        INPUT
+            user; Discord User object who will own the channel
+            overwrites; dictionary of Discord permission overwrites for the channel
+        '''
+        await self.evict_idle()
+        if not self.idle:
+            self.created += 1
+            return await self.category.create_text_channel(user.name, overwrites=overwrites)
+
+        # Prefer the channel this user had before. Another user's channel is cleared of its old messages first.
+        entry = next((entry for entry in self.idle if entry[1] == user.id), self.idle[-1])
+        self.idle.remove(entry)
+        channel = entry[0]
+        if entry[1] != user.id:
+            await channel.purge(limit=None)
+        await channel.edit(name=user.name, overwrites=overwrites)
+        self.reused += 1
+        return channel
+
+    async def release(self, channel, user):
+        '''
+        Hides the channel from its user and returns it to the pool, or deletes it if the pool is full
+        INPUT
+            channel; Discord channel to release
+            user; Discord User object who owned the channel
+        '''
+        if len(self.idle) >= self.max_idle:
+            await channel.delete()
+            return
+        await channel.set_permissions(user, overwrite=None)
+        self.idle.append([channel, user.id, monotonic()])
+        self.schedule_eviction()
+
+    def schedule_eviction(self):
+        '''
+        Schedules the eviction of the oldest idle channel, unless one is already scheduled
+        '''
+        if self.timer is None and self.idle:
+            self.timer = SCHEDULER.call_at(self.idle[0][2] + self.idle_timeout, self.on_eviction_timer)
+
+    async def on_eviction_timer(self):
+        '''
+        Deletes the expired idle channels, then schedules the next eviction
+        '''
+        self.timer = None
+        await self.evict_idle()
+        self.schedule_eviction()
+
+    def close(self):
+        '''
+        Stops evicting channels, for a game that ended. Its idle channels are left for $prune to delete with the category.
+        '''
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        self.idle = []
+
+    async def evict_idle(self):
+        '''
+        Deletes channels that have been idle longer than idle_timeout
+        '''
+        # Detach the expired channels before awaiting, so overlapping evictions never see the same channel
+        now = monotonic()
+        expired = [entry[0] for entry in self.idle if now - entry[2] >= self.idle_timeout]
+        if not expired:
+            return
+        self.idle = [entry for entry in self.idle if now - entry[2] < self.idle_timeout]
+        for channel in expired:
+            try:
+                await channel.delete()
+            except Exception as e:
+                print(f"Failed to delete idle channel {channel}: {e!r}")
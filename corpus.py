@@ -0,0 +1,244 @@
+"""
+Compact binary keyword corpus, opened with mmap so large corpora are shared between processes instead of copied.
+
+File layout (little-endian):
+    header      8-byte magic, uint32 entry count, uint32 category count, uint32 bucket count
+    categories  per category, uint16 byte length followed by the UTF-8 name
+    buckets     per (category, difficulty) bucket, uint16 category id, uint16 difficulty,
+                uint32 first entry index, uint32 entry count
+    offsets     entry count + 1 uint32 offsets into the string blob. Entries are sorted by bucket.
+    strings     UTF-8 keywords, back to back
+
+Build a corpus from text lists with lines of "keyword", "keyword<TAB>category" or "keyword<TAB>category<TAB>difficulty":
+    python corpus.py build animals.txt foods.tsv -o keywords.bin
+"""
+
+import argparse
+import bisect
+import mmap
+import os
+import random
+import struct
+
+MAGIC = b"WITCORP1"
+HEADER = struct.Struct("<8sIII")
+BUCKET = struct.Struct("<HHII")
+OFFSET = struct.Struct("<I")
+NAME_LENGTH = struct.Struct("<H")
+
+class Corpus:
+    '''
+    Read-only view of a binary corpus file. Keywords are decoded from the mmap only when sampled.
+    '''
+
+    path = None         # Path of the corpus file
+    file = None         # Open file object backing the mmap
+    data = None         # mmap of the corpus file
+    size = None         # Number of keywords
+    categories = None   # List of string category names, indexed by category id
+    buckets = None      # List of (category id, difficulty, first entry index, entry count), sorted by first entry index
+    offsets_at = None   # Byte position of the offsets table
+    strings_at = None   # Byte position of the string blob
+    filters = None      # Dictionary mapping (category, difficulty) filters to (list of buckets, cumulative entry counts)
+
+    def __init__(self, path):
+        '''
+        Opens the corpus file
+        INPUT
+            path; path of a corpus file written by build()
+        '''
+        self.path = path
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.size, n_categories, n_buckets = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a Witness corpus file.")
+
+        # Read the category names and bucket table
+        at = HEADER.size
+        self.categories = []
+        for _ in range(n_categories):
+            (length,) = NAME_LENGTH.unpack_from(self.data, at)
+            at += NAME_LENGTH.size
+            self.categories.append(self.data[at:at + length].decode("utf-8"))
+            at += length
+        self.buckets = [BUCKET.unpack_from(self.data, at + i * BUCKET.size) for i in range(n_buckets)]
+        self.offsets_at = at + n_buckets * BUCKET.size
+        self.strings_at = self.offsets_at + (self.size + 1) * OFFSET.size
+        self.filters = {}
+
+    def __len__(self):
+        return self.size
+
+    def close(self):
+        '''
+        Closes the mmap and its file
+        '''
+        self.data.close()
+        self.file.close()
+
+    def get(self, index):
+        '''
+        RETURNS the string keyword at the given entry index
+        INPUT
+            index; integer entry index
+        '''
+        start, end = struct.unpack_from("<II", self.data, self.offsets_at + index * OFFSET.size)
+        return self.data[self.strings_at + start:self.strings_at + end].decode("utf-8")
+
+    def describe(self, index):
+        '''
+        RETURNS tuple of the string category and integer difficulty of the entry at the given index
+        INPUT
+            index; integer entry index
+        '''
+        starts = [bucket[2] for bucket in self.buckets]
+        category_id, difficulty, _, _ = self.buckets[bisect.bisect_right(starts, index) - 1]
+        return self.categories[category_id], difficulty
+
+    def get_filter(self, category=None, difficulty=None):
+        '''
+        RETURNS tuple of the buckets matching the filter and their cumulative entry counts. Results are cached per filter.
+        INPUT
+            category; string category to match, or None for any
+            difficulty; integer difficulty to match, or None for any
+        '''
+        key = (category, difficulty)
+        if key not in self.filters:
+            matching = [bucket for bucket in self.buckets
+                        if (category is None or self.categories[bucket[0]] == category)
+                        and (difficulty is None or bucket[1] == difficulty)]
+            totals = []
+            total = 0
+            for bucket in matching:
+                total += bucket[3]
+                totals.append(total)
+            self.filters[key] = (matching, totals)
+        return self.filters[key]
+
+    def sample(self, category=None, difficulty=None, rng=random):
+        '''
+        RETURNS a uniformly random string keyword matching the filter, or None if no keyword matches
+        INPUT
+            category; string category to match, or None for any
+            difficulty; integer difficulty to match, or None for any
+            rng; random.Random instance to draw from
+        '''
+        view = CorpusView(self, category, difficulty)
+        if not len(view):
+            return None
+        return view[rng.randrange(len(view))]
+
+class CorpusView:
+    '''
+    Sequence of the keywords of a Corpus that match a filter. Keywords are decoded from the mmap only when indexed.
+    '''
+
+    corpus = None   # Corpus viewed
+    buckets = None  # List of the buckets matching the filter
+    totals = None   # List of cumulative entry counts of the buckets
+
+    def __init__(self, corpus, category=None, difficulty=None):
+        '''
+        Initializes this view
+        INPUT
+            corpus; Corpus to view
+            category; string category to match, or None for any
+            difficulty; integer difficulty to match, or None for any
+        '''
+        self.corpus = corpus
+        self.buckets, self.totals = corpus.get_filter(category, difficulty)
+
+    def __len__(self):
+        return self.totals[-1] if self.totals else 0
+
+    def __getitem__(self, position):
+        '''
+        RETURNS the string keyword at the given position among the matching keywords
+        INPUT
+            position; integer from 0 to len(self) - 1
+        '''
+        i = bisect.bisect_right(self.totals, position)
+        bucket = self.buckets[i]
+        return self.corpus.get(bucket[2] + position - (self.totals[i] - bucket[3]))
+
+def read_text_list(path, category=None, difficulty=1):
+    '''
+    RETURNS list of (keyword, category, difficulty) tuples read from a text list
+    INPUT
+        path; path of a text file with one "keyword[<TAB>category[<TAB>difficulty]]" entry per line
+        category; category for lines without one. Defaults to the file name without extension.
+        difficulty; integer difficulty for lines without one
+    '''
+    if category is None:
+        category = os.path.splitext(os.path.basename(path))[0]
+    entries = []
+    with open(path, encoding="utf-8-sig") as f:
+        for line in f:
+            fields = [field.strip() for field in line.rstrip("\n").split("\t")]
+            if not fields[0]:
+                continue
+            entries.append((fields[0],
+                            fields[1] if len(fields) > 1 and fields[1] else category,
+                            int(fields[2]) if len(fields) > 2 and fields[2] else difficulty))
+    return entries
+
+def build(entries, path):
+    '''
+    Writes a corpus file
+    INPUT
+        entries; iterable of (keyword, category, difficulty) tuples
+        path; path of the corpus file to write
+    '''
+    # Group entries by bucket, dropping duplicates within a bucket
+    categories = {}
+    grouped = {}
+    for keyword, category, difficulty in entries:
+        category_id = categories.setdefault(category, len(categories))
+        grouped.setdefault((category_id, difficulty), {})[keyword] = None
+
+    buckets = []
+    blob = bytearray()
+    offsets = [0]
+    for (category_id, difficulty), keywords in sorted(grouped.items()):
+        buckets.append((category_id, difficulty, len(offsets) - 1, len(keywords)))
+        for keyword in keywords:
+            blob += keyword.encode("utf-8")
+            offsets.append(len(blob))
+
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(offsets) - 1, len(categories), len(buckets)))
+        for category in categories:
+            name = category.encode("utf-8")
+            f.write(NAME_LENGTH.pack(len(name)) + name)
+        for bucket in buckets:
+            f.write(BUCKET.pack(*bucket))
+        f.write(struct.pack(f"<{len(offsets)}I", *offsets))
+        f.write(blob)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or sample a binary keyword corpus.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="convert text lists into a corpus file")
+    build_parser.add_argument("inputs", nargs="+", help="text lists of keywords")
+    build_parser.add_argument("-o", "--output", required=True, help="corpus file to write")
+    build_parser.add_argument("--category", help="category for lines without one. Defaults to each file's name.")
+    build_parser.add_argument("--difficulty", type=int, default=1, help="difficulty for lines without one")
+    sample_parser = subparsers.add_parser("sample", help="print random keywords from a corpus file")
+    sample_parser.add_argument("corpus")
+    sample_parser.add_argument("--category")
+    sample_parser.add_argument("--difficulty", type=int)
+    sample_parser.add_argument("-n", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        entries = []
+        for path in args.inputs:
+            entries += read_text_list(path, args.category, args.difficulty)
+        build(entries, args.output)
+        corpus = Corpus(args.output)
+        print(f"Wrote {len(corpus)} keywords in {len(corpus.categories)} categories and {len(corpus.buckets)} buckets to {args.output}.")
+    else:
+        corpus = Corpus(args.corpus)
+        for _ in range(args.n):
+            print(corpus.sample(args.category, args.difficulty))
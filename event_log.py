@@ -0,0 +1,125 @@
+"""
+Append-only log of game events as JSON lines.
+Events are buffered in memory and written in batches by a background task, and the log files rotate by size.
+"""
+
+import asyncio
+import json
+import os
+from time import time
+
+# Directory of the log files
+LOG_DIR = os.getenv("WITNESS_LOG_DIR", "logs")
+
+# Events are written once this many are buffered, or every FLUSH_INTERVAL seconds
+BATCH_SIZE = 256
+FLUSH_INTERVAL = 2
+
+# The log rotates when it grows past MAX_BYTES. BACKUP_COUNT rotated files are kept.
+MAX_BYTES = int(os.getenv("WITNESS_LOG_MAX_BYTES", 10 * 1024 * 1024))
+BACKUP_COUNT = 5
+
+class EventLog:
+    '''
+    Buffered, append-only JSON lines log with size-based rotation.
+    '''
+
+    path = None     # Path of the current log file
+    buffer = None   # List of event dictionaries not yet written
+    task = None     # asyncio.Task writing buffered events
+    wake = None     # asyncio.Event set when the buffer reaches BATCH_SIZE
+    written = None  # Number of events written so far
+
+    def __init__(self, directory=LOG_DIR, name="events.jsonl"):
+        '''
+        Initializes this log
+        INPUT
+            directory; directory of the log files
+            name; file name of the current log file
+        '''
+        self.path = os.path.join(directory, name)
+        self.buffer = []
+        self.task = None
+        self.wake = None
+        self.written = 0
+
+    def log(self, kind, game=None, **fields):
+        '''
+        Buffers an event. Never waits on disk.
+        INPUT
+            kind; string event type, such as "join" or "ask"
+            game; Game object the event belongs to, or None
+            fields; JSON-serializable event details
+        '''
+        event = {"t": round(time(), 3), "kind": kind}
+        if game is not None:
+            event["guild"] = game.category.guild.id
+            event["game"] = game.category.id
+        event.update(fields)
+        self.buffer.append(event)
+
+        if self.task is None or self.task.done():
+            self.wake = asyncio.Event()
+            self.task = asyncio.create_task(self.run())
+        elif len(self.buffer) >= BATCH_SIZE:
+            self.wake.set()
+
+    async def run(self):
+        '''
+        Writes buffered events every FLUSH_INTERVAL seconds, or sooner when BATCH_SIZE events are buffered
+        '''
+        while self.buffer:
+            try:
+                await asyncio.wait_for(self.wake.wait(), FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self.wake.clear()
+            await self.flush()
+
+    async def flush(self):
+        '''
+        Writes all buffered events now
+        '''
+        batch = self.buffer
+        self.buffer = []
+        if batch:
+            try:
+                await asyncio.to_thread(self.write, batch)
+            except Exception as e:
+                print(f"Failed to write {len(batch)} game events: {e!r}")
+
+    def write(self, batch):
+        '''
+        Appends a batch of events to the log file, rotating it first if it is too large
+        INPUT
+            batch; list of event dictionaries
+        '''
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        if os.path.exists(self.path) and os.path.getsize(self.path) >= MAX_BYTES:
+            self.rotate()
+        lines = "".join(json.dumps(event, separators=(",", ":"), default=str) + "\n" for event in batch)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+        self.written += len(batch)
+
+    def rotate(self):
+        '''
+        Renames the log file to .1, shifting older rotated files up and dropping the oldest
+        '''
+        for i in range(BACKUP_COUNT - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+# Event log shared by all games
+EVENT_LOG = EventLog()
+
+def log_event(kind, game=None, **fields):
+    '''
+    Buffers an event in the shared event log
+    INPUT
+        kind; string event type
+        game; Game object the event belongs to, or None
+        fields; JSON-serializable event details
+    '''
+    EVENT_LOG.log(kind, game, **fields)
@@ -0,0 +1,178 @@
+"""
+Local stand-in for the OpenAI ChatCompletion API, for load testing the WITNESS without the network.
+Answers with templated or canned responses, and can inject latency, rate limiting (429), server errors (5xx) and timeouts.
+
+Point the bot at it by setting OPENAI_API_BASE before starting the bot:
+    python fake_openai.py --port 8000 --latency lognormal:0.8,0.4 --rate-429 0.05 --rate-5xx 0.02
+    OPENAI_API_BASE=http://127.0.0.1:8000/v1 OPENAI_API_KEY=local python main.py
+
+GET /stats reports the number of requests served and faults injected.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+from aiohttp import web
+
+# Templates for the answers. Fields are {keyword}, {question} and {n_words}, taken from the bot's prompt.
+ANSWER_TEMPLATE = "It is something people think of when asked {question} and it is often found near other ordinary everyday things"
+BANNED_WORDS_TEMPLATE = "clue hint sign trace mark evidence token signal"
+
+# Number of characters per token when estimating usage
+CHARS_PER_TOKEN = 4
+
+# Patterns for the fields of the bot's prompts
+FIELD_PATTERNS = {"keyword": re.compile(r'Keyword: "([^"]*)"'),
+                  "question": re.compile(r'Question: "([^"]*)"'),
+                  "n_words": re.compile(r"(?:Length|Word count): (\d+)")}
+
+def parse_latency(spec):
+    '''
+    RETURNS a function that samples a latency in seconds
+    INPUT
+        spec; string "<distribution>:<parameters>", one of
+            fixed:SECONDS, uniform:LOW,HIGH, normal:MEAN,STDEV, exponential:MEAN, lognormal:MEDIAN,SIGMA
+    '''
+    name, _, params = spec.partition(":")
+    values = [float(value) for value in params.split(",") if value]
+    samplers = {"fixed": lambda: values[0],
+                "uniform": lambda: random.uniform(values[0], values[1]),
+                "normal": lambda: max(0, random.gauss(values[0], values[1])),
+                "exponential": lambda: random.expovariate(1 / values[0]) if values[0] > 0 else 0,
+                "lognormal": lambda: values[0] * random.lognormvariate(0, values[1])}
+    if name not in samplers:
+        raise ValueError(f"Unknown latency distribution {name!r}. Choose from {', '.join(samplers)}.")
+    return samplers[name]
+
+def count_tokens(text):
+    '''
+    RETURNS estimated integer number of tokens in the text
+    '''
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+class FakeOpenAI:
+    '''
+    aiohttp application serving /v1/chat/completions with configurable responses and faults.
+    '''
+
+    latency = None          # Function sampling the seconds to wait before answering
+    rate_429 = None         # Probability of answering 429 Too Many Requests
+    rate_5xx = None         # Probability of answering 500, 502 or 503
+    rate_timeout = None     # Probability of never answering (until hang seconds have passed)
+    hang = None             # Seconds a timed out request is held open
+    responses = None        # List of canned answer strings, or None to fill in ANSWER_TEMPLATE
+    stats = None            # Dictionary counting requests served and faults injected
+
+    def __init__(self, latency="fixed:0", rate_429=0, rate_5xx=0, rate_timeout=0, hang=600, responses=None):
+        self.latency = parse_latency(latency)
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.rate_timeout = rate_timeout
+        self.hang = hang
+        self.responses = responses
+        self.stats = {"requests": 0, "ok": 0, "429": 0, "5xx": 0, "timeout": 0}
+
+    def make_app(self):
+        '''
+        RETURNS the aiohttp web Application
+        '''
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.chat_completions)
+        app.router.add_post("/chat/completions", self.chat_completions)
+        app.router.add_get("/stats", self.get_stats)
+        return app
+
+    def make_answer(self, body):
+        '''
+        RETURNS string answer to the ChatCompletion request body
+        '''
+        prompt = body["messages"][-1]["content"]
+        fields = {"keyword": "", "question": "", "n_words": ""}
+        for name, pattern in FIELD_PATTERNS.items():
+            found = pattern.search(prompt)
+            if found:
+                fields[name] = found.group(1)
+        if prompt.startswith("Keyword:"):
+            return BANNED_WORDS_TEMPLATE.format(**fields)
+        if self.responses:
+            return random.choice(self.responses).format(**fields)
+        return ANSWER_TEMPLATE.format(**fields)
+
+    async def chat_completions(self, request):
+        '''
+        Handles a ChatCompletion request
+        '''
+        self.stats["requests"] += 1
+        body = await request.json()
+        await asyncio.sleep(self.latency())
+
+        # Inject faults
+        fault = random.random()
+        if fault < self.rate_timeout:
+            self.stats["timeout"] += 1
+            await asyncio.sleep(self.hang)
+            return web.Response(status=504)
+        fault -= self.rate_timeout
+        if fault < self.rate_429:
+            self.stats["429"] += 1
+            return web.json_response({"error": {"message": "Rate limit reached (injected).", "type": "requests", "code": None}},
+                                     status=429)
+        fault -= self.rate_429
+        if fault < self.rate_5xx:
+            self.stats["5xx"] += 1
+            return web.json_response({"error": {"message": "The server had an error (injected).", "type": "server_error", "code": None}},
+                                     status=random.choice([500, 502, 503]))
+
+        # Answer
+        answer = self.make_answer(body)
+        prompt_tokens = sum(count_tokens(message["content"]) for message in body["messages"])
+        completion_tokens = count_tokens(answer)
+        self.stats["ok"] += 1
+        return web.json_response({"id": f"chatcmpl-fake{self.stats['requests']}",
+                                  "object": "chat.completion",
+                                  "created": int(time.time()),
+                                  "model": body.get("model", "gpt-3.5-turbo"),
+                                  "choices": [{"index": 0,
+                                               "message": {"role": "assistant", "content": answer},
+                                               "finish_reason": "stop"}],
+                                  "usage": {"prompt_tokens": prompt_tokens,
+                                            "completion_tokens": completion_tokens,
+                                            "total_tokens": prompt_tokens + completion_tokens}})
+
+    async def get_stats(self, request):
+        return web.json_response(self.stats)
+
+    async def start(self, host="127.0.0.1", port=8000):
+        '''
+        Starts serving on the current event loop
+        RETURNS
+            the aiohttp AppRunner, whose cleanup() stops the server
+        '''
+        runner = web.AppRunner(self.make_app())
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for the OpenAI ChatCompletion API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", default="fixed:0",
+                        help="latency distribution, e.g. fixed:0.5, uniform:0.2,1, normal:1,0.3, exponential:0.8, lognormal:0.8,0.4")
+    parser.add_argument("--rate-429", type=float, default=0, help="probability of answering 429 Too Many Requests")
+    parser.add_argument("--rate-5xx", type=float, default=0, help="probability of answering a 5xx server error")
+    parser.add_argument("--rate-timeout", type=float, default=0, help="probability of not answering until --hang seconds pass")
+    parser.add_argument("--hang", type=float, default=600, help="seconds a timed out request is held open")
+    parser.add_argument("--responses", help="JSON file with a list of canned answers, which may use {keyword}, {question} and {n_words}")
+    args = parser.parse_args()
+
+    responses = None
+    if args.responses:
+        with open(args.responses) as f:
+            responses = json.load(f)
+    server = FakeOpenAI(args.latency, args.rate_429, args.rate_5xx, args.rate_timeout, args.hang, responses)
+    print(f"Serving a fake OpenAI API at http://{args.host}:{args.port}/v1")
+    web.run_app(server.make_app(), host=args.host, port=args.port, print=None)
@@ -0,0 +1,193 @@
+"""
+GameRegistry indexes ongoing Witness games for routing Discord messages and reactions.
+GameManager adds game quotas and removal of finished games.
+"""
+
+import os
+import snapshots
+from scheduler import SCHEDULER
+
+# Game quotas
+MAX_GAMES_PER_GUILD = int(os.getenv("MAX_GAMES_PER_GUILD", 3))
+MAX_GAMES_TOTAL = int(os.getenv("MAX_GAMES_TOTAL", 500))
+
+# Seconds of inactivity after which a game is abandoned
+IDLE_TIMEOUT = int(os.getenv("GAME_IDLE_TIMEOUT", 3600))
+
+# Seconds between sweeps for ended and abandoned games
+REAP_INTERVAL = 60
+
+class GameRegistry:
+    '''
+    Indexes ongoing games by the id of their Discord category and registration message.
+    '''
+
+    by_category = None      # Dictionary mapping each game's Discord category id to its Game object
+    by_registration = None  # Dictionary mapping each game's registration message id to its Game object
+    reserved = None         # Set of ids of categories created for games that are still being set up
+
+    def __init__(self):
+        '''
+        Initializes an empty registry
+        '''
+        self.by_category = {}
+        self.by_registration = {}
+        self.reserved = set()
+
+    def __len__(self):
+        return len(self.by_category)
+
+    def __iter__(self):
+        return iter(list(self.by_category.values()))
+
+    def add(self, game):
+        '''
+        Registers the given game
+        INPUT
+            game; Game object
+        '''
+        self.by_category[game.category.id] = game
+        self.by_registration[game.registration_msg.id] = game
+
+    def reserve_category(self, category_id):
+        '''
+        Marks the given Discord category id as taken by a game that is still being set up
+        INPUT
+            category_id; integer Discord category id
+        '''
+        self.reserved.add(category_id)
+
+    def release_category(self, category_id):
+        '''
+        Undoes reserve_category(), once the game is set up (and about to be added) or failed to set up
+        INPUT
+            category_id; integer Discord category id
+        '''
+        self.reserved.discard(category_id)
+
+    def remove(self, game):
+        '''
+        Unregisters the given game
+        INPUT
+            game; Game object
+        '''
+        self.by_category.pop(game.category.id, None)
+        self.by_registration.pop(game.registration_msg.id, None)
+
+    def for_channel(self, channel):
+        '''
+        RETURNS the Game hosted in the given channel's category, or None
+        INPUT
+            channel; Discord channel
+        '''
+        return self.by_category.get(getattr(channel, "category_id", None))
+
+    def for_registration(self, message_id):
+        '''
+        RETURNS the Game whose registration message has the given id, or None
+        INPUT
+            message_id; integer Discord message id
+        '''
+        return self.by_registration.get(message_id)
+
+    def owns_category(self, category_id):
+        '''
+        RETURNS boolean whether the given Discord category id hosts an ongoing game, or one still being set up
+        INPUT
+            category_id; integer Discord category id
+        '''
+        return category_id in self.by_category or category_id in self.reserved
+
+class GameManager(GameRegistry):
+    '''
+    GameRegistry that enforces per-guild and global game quotas and removes finished or abandoned games.
+    '''
+
+    max_per_guild = None    # Maximum number of ongoing games in one guild
+    max_total = None        # Maximum number of ongoing games across all guilds
+    idle_timeout = None     # Seconds of inactivity after which a game is abandoned
+    by_guild = None         # Dictionary mapping each guild id to the set of its ongoing Game objects
+    created = None          # Number of games registered since startup
+    reaped = None           # Number of games removed because they ended or were abandoned
+
+    def __init__(self, max_per_guild=MAX_GAMES_PER_GUILD, max_total=MAX_GAMES_TOTAL, idle_timeout=IDLE_TIMEOUT):
+        '''
+        Initializes an empty manager
+        INPUT
+            max_per_guild; maximum number of ongoing games in one guild
+            max_total; maximum number of ongoing games across all guilds
+            idle_timeout; seconds of inactivity after which a game is abandoned
+        '''
+        super().__init__()
+        self.max_per_guild = max_per_guild
+        self.max_total = max_total
+        self.idle_timeout = idle_timeout
+        self.by_guild = {}
+        self.created = 0
+        self.reaped = 0
+
+    def check_quota(self, guild_id):
+        '''
+        RETURNS string reason a new game cannot be created in the given guild, or None if it can
+        INPUT
+            guild_id; integer Discord guild id
+        '''
+        if len(self) >= self.max_total:
+            return f"Cannot create a new game. The bot is already hosting {self.max_total} games."
+        if len(self.by_guild.get(guild_id, ())) >= self.max_per_guild:
+            return f"Cannot create a new game. This server already has {self.max_per_guild} ongoing games."
+        return None
+
+    def add(self, game):
+        super().add(game)
+        self.by_guild.setdefault(game.category.guild.id, set()).add(game)
+        self.created += 1
+
+    def remove(self, game):
+        super().remove(game)
+        snapshots.forget(game)
+        guild_games = self.by_guild.get(game.category.guild.id)
+        if guild_games is not None:
+            guild_games.discard(game)
+            if not guild_games:
+                del self.by_guild[game.category.guild.id]
+
+    def reap(self):
+        '''
+        Removes games that ended or were abandoned
+        RETURNS
+            list of the removed Game objects
+        '''
+        removed = [game for game in self
+                   if game.ended or game.is_abandoned(self.idle_timeout)]
+        for game in removed:
+            game.end()
+            self.remove(game)
+        self.reaped += len(removed)
+        return removed
+
+    def start_reaping(self, interval=REAP_INTERVAL):
+        '''
+        Reaps ended and abandoned games every interval seconds
+        INPUT
+            interval; seconds between reaps
+        '''
+        def reap_and_reschedule():
+            self.reap()
+            SCHEDULER.call_later(interval, reap_and_reschedule)
+        SCHEDULER.call_later(interval, reap_and_reschedule)
+
+    def metrics(self):
+        '''
+        RETURNS dictionary of counts describing the ongoing games
+        '''
+        phases = {}
+        for game in self:
+            phase = type(game.gamestate).__name__
+            phases[phase] = phases.get(phase, 0) + 1
+        return {"active_games": len(self),
+                "active_guilds": len(self.by_guild),
+                "active_players": sum(len(game.player_list) for game in self),
+                "games_by_phase": phases,
+                "created": self.created,
+                "reaped": self.reaped}
@@ -4,32 +4,67 @@ Contains Game and Player classes for Witness gameplay.
 
 import discord
 import random
+from time import monotonic
 import gamestates as gs
 import player_roles as pr
+import snapshots
+import usage
+from event_log import log_event
+from messaging import fan_out, Outbox
+from channel_pool import ChannelPool
 
 class Game:
     '''
     Encapsulates methods and attributes for a single Witness game.
     '''
     category = None         # The discord category that hosts this game
+    channel_pool = None     # ChannelPool of idle private channels in this game's category
     registration_msg = None # The discord message that users react to to register for this game 
     keyword = None          # The keyword for this game
+    keyword_signature = None    # The word_match.MatchSignature used to check guesses of the keyword
     player_list = None      # List of players  
+    players_by_id = None    # Dictionary mapping each player's Discord user id to their Player object
+    players_by_name = None  # Dictionary mapping each player's Discord user name to their Player object
     questioner = None       # Index of the player who is the current questioner
     role_dict = None        # Dictionary mapping a string title of each role to the list of players with that role
     gamestate = None        # The GameState object describing the phase of the game
     gpt_witness = None      # The GptWitness object that provides the WITNESS clues
     settings = None         # Dictionary mapping a string name for each game setting to its natural number value
-    powers = {}
+    powers = None           # Dictionary mapping the title of each role that activated its power this round to the power's value
+    last_activity = None    # The monotonic() time of the most recent message or join in this game
+    ended = None            # Boolean whether the game host ended this game
+    start_latency = None    # Seconds from the most recent $start until the game reached Questioning
+    usage = None            # Dictionary mapping each OpenAI call type to the usage.UsageCounter of the calls of the current
+                            # (or, until the next $start, the most recent) game on this category
 
-    async def initialize(trigger_msg):
+    async def initialize(trigger_msg, registry=None):
         '''
         RETURNS this initialized Game object.
+        INPUT
+            trigger_msg; Discord Message with the "$play" command
+            registry; GameRegistry that reserves the new category while the game is set up, so $prune leaves it alone.
+                The caller adds the game to the registry once this returns.
         '''
         self = Game()
 
         # Create game category
         self.category = await trigger_msg.guild.create_category("Witness-" + str(random.randint(1000, 9999)))
+        if registry is not None:
+            registry.reserve_category(self.category.id)
+        try:
+            await self.initialize_helper(trigger_msg)
+        finally:
+            if registry is not None:
+                registry.release_category(self.category.id)
+        return self
+
+    async def initialize_helper(self, trigger_msg):
+        '''
+        Sets up this game in its new category: the registration message, settings, host and Creation phase
+        INPUT
+            trigger_msg; Discord Message with the "$play" command
+        '''
+        self.channel_pool = ChannelPool(self.category)
         
         # Create registration message
         self.registration_msg = await trigger_msg.channel.send(f"React to this message to play Witness: Social Deduction Word Game. After reacting, check category `{self.category}` for your private channel. Up to 12 players may join.")
@@ -37,6 +72,12 @@ class Game:
         
         # Initialize settings and parameters
         self.player_list = []
+        self.players_by_id = {}
+        self.players_by_name = {}
+        self.powers = {}
+        self.usage = {}
+        self.ended = False
+        self.last_activity = monotonic()
         self.default_settings()
 
         # Set the game host as the user who sent the "$play" message
@@ -45,7 +86,7 @@ class Game:
 
         # Start the Creation gamestate
         self.gamestate = await gs.GameStateCreation.initialize(self)
-        return self
+        snapshots.save_now(self)
     
     def default_settings(self):
         '''
@@ -73,7 +114,8 @@ class Game:
             await ply.send_message("`$showroles` shows the roles."
                                     + "`$role <add/remove> <roletitle>` adds/removes a special role to the game."
                                     + "\n`$<settingname> <settingvalue>` changes a specific setting."
-                                    + "\n`$resetdefaultsettings` resets to defaults.")
+                                    + "\n`$resetdefaultsettings` resets to defaults."
+                                    + "\n`$usage` shows this game's OpenAI token usage.")
 
     async def add_player(self, user):
         '''
@@ -85,9 +127,42 @@ class Game:
         '''
         player = await Player.initialize(user, self)
         self.player_list.append(player)
+        self.players_by_id[user.id] = player
+        self.players_by_name[user.name] = player
+        self.last_activity = monotonic()
+        log_event("join", self, user=user.id, name=user.name)
+        if self.gamestate is not None:
+            snapshots.mark_dirty(self)
         await self.send_global_message(f"`{user.name}` joined the game! There are now {len(self.player_list)} players.")
         return player
     
+    def remove_player(self, player):
+        '''
+        Removes the given player from this game
+        INPUT
+            player; Player object to remove
+        '''
+        self.player_list.remove(player)
+        del self.players_by_id[player.user.id]
+        if self.players_by_name.get(player.user.name) is player:
+            del self.players_by_name[player.user.name]
+
+    def get_player(self, user_id):
+        '''
+        RETURNS the Player object for the given Discord user id, or None if that user is not playing
+        INPUT
+            user_id; integer Discord user id
+        '''
+        return self.players_by_id.get(user_id)
+
+    def get_player_by_name(self, name):
+        '''
+        RETURNS the Player object for the given Discord user name, or None if no player has that name
+        INPUT
+            name; string Discord user name
+        '''
+        return self.players_by_name.get(name)
+
     async def send_game_creation_message(self):
         '''
         Sends the game creation message to the game host.
@@ -95,14 +170,14 @@ class Game:
         await self.player_list[0].send_message("**You are the game host. Use `$showsettings` to change settings. Use `$showroles` to view roles. Use `$start` to start the game.**")
         return
 
-    async def send_global_message(self, content):
+    async def send_global_message(self, content, flush=False):
         '''
         Sends the given message to all players.
         INPUT
             content; string message to send to all players
+            flush; boolean whether to deliver the message immediately instead of merging it with the next messages
         '''
-        for player in self.player_list:
-            await player.send_message(content)
+        await fan_out(self.player_list, content, flush=flush)
         return
 
     def get_questioner(self):
@@ -117,34 +192,87 @@ class Game:
         INPUT
             message; Discord Message object to handle
         '''
+        self.last_activity = monotonic()
+
         # If $showsettings, sends message to author summarizing game settings
         if message.content == "$showsettings":
-            for ply in self.player_list:
-                if ply.user.id == message.author.id:
-                    await self.print_settings(ply)
-                    return
+            ply = self.get_player(message.author.id)
+            if ply is not None:
+                await self.print_settings(ply)
+                return
         
         # If $showroles, sends message to author summarizing roles
         if message.content == "$showroles":
-            for ply in self.player_list:
-                if ply.user.id == message.author.id:
-                    await ply.send_message(pr.get_role_desc())
-                    return 
+            ply = self.get_player(message.author.id)
+            if ply is not None:
+                await ply.send_message(pr.get_role_desc())
+                return 
+
+        # If $usage, sends the game host this game's OpenAI token usage
+        if message.content == "$usage" and message.author.id == self.player_list[0].user.id:
+            await self.player_list[0].send_message(usage.summarize_game(self))
+            return
 
         # If $resetdefaultsettings, resets the default settings
         if message.content == "$resetdefaultsettings" and message.author.id == self.player_list[0].user.id:
             self.default_settings()
+            log_event("settings", self, reset=True)
+            if isinstance(self.gamestate, gs.GameStateCreation):
+                self.gamestate.start_prewarm()
             await self.send_global_message("Game host reset settings to defaults.")
        
         # If $restartgame, restarts game
         if message.content == "$restartgame" and message.author.id == self.player_list[0].user.id:
-            await self.gamestate.conclude()
+            if self.gamestate.begin_proceed():
+                await self.gamestate.conclude()
+
+        # If $endgame, ends the game for good
+        if message.content == "$endgame" and message.author.id == self.player_list[0].user.id:
+            await self.send_global_message("Game host ended the game. Use `$prune` to clean up its channels.")
+            self.end()
+            return
         
         # Otherwise, let the GameState handle the message
+        gamestate = self.gamestate
         await self.gamestate.handle_message(message)
+        self.save_snapshot(phase_changed=self.gamestate is not gamestate)
+
+    def save_snapshot(self, phase_changed):
+        '''
+        Snapshots this game so it can be restored after a restart
+        INPUT
+            phase_changed; boolean whether the game changed phase, in which case the snapshot is written right away
+        '''
+        if phase_changed:
+            log_event("phase", self, phase=type(self.gamestate).__name__)
+            snapshots.save_now(self)
+        else:
+            snapshots.mark_dirty(self)
+
+    def end(self):
+        '''
+        Ends this game and stops its timers and background tasks
+        '''
+        self.ended = True
+        self.channel_pool.close()
+        if self.gamestate is not None:
+            self.gamestate.cancel_timers()
+            if isinstance(self.gamestate, gs.GameStateCreation):
+                for task in (self.gamestate.prewarm_task, self.gamestate.keyword_task):
+                    if task is not None:
+                        task.cancel()
+
+    def is_abandoned(self, idle_timeout):
+        '''
+        RETURNS boolean whether this game has no players or has been idle longer than idle_timeout seconds
+        INPUT
+            idle_timeout; seconds of inactivity after which a game is abandoned
+        '''
+        return not self.player_list or monotonic() - self.last_activity > idle_timeout
 
     async def activate_power(self, title, value):
         self.powers[title] = value
+        log_event("power", self, role=title, value=value)
 
 class Player:
     '''
@@ -153,6 +281,7 @@ class Player:
     user = None     # This player's Discord User object
     game = None     # The game object
     channel = None  # This player's dedicated Discord channel for this game
+    outbox = None   # Outbox that merges messages to this player's channel
     role = None     # This player's role
 
     async def initialize(user, game):
@@ -166,6 +295,7 @@ class Player:
         self.game = game
         self.role = None
         self.channel = await self.create_private_channel(user)
+        self.outbox = Outbox(self.channel)
         await self.send_message(f"Welcome, <@{user.id}>, to **Witness: The Social Deducation Word Game**, powered by **GPT-3.5 Turbo** and written by <@451570118846054432>!"
                                 + "\n:supervillain: A heinous crime has upset the city. It's up to you to find the villains and restore the peace!"
                                 + "\n:key: A secret keyword will be chosen by when the game begins. The Civilians want to figure out the keyword by the end of the game. The Villains, who know the keyword, want to keep the keyword a secret by misleading the Civilians."
@@ -177,7 +307,7 @@ class Player:
 
     async def create_private_channel(self, user):
         '''
-        Creates this player's dedicated private gameplay channel
+        Gets this player's dedicated private gameplay channel from the game's channel pool
         INPUT
             user; this player's the Discord User object
         '''
@@ -188,17 +318,28 @@ class Player:
             self.game.category.guild.me: discord.PermissionOverwrite(view_channel=True)
         }
 
-        # Make channel
-        channel = await self.game.category.create_text_channel(user.name, overwrites=overwrites)
+        # Make channel, or reuse an idle one
+        channel = await self.game.channel_pool.acquire(user, overwrites)
         return channel
+
+    async def release_private_channel(self):
+        '''
+        Returns this player's private channel to the game's channel pool. Undelivered messages are dropped.
+        '''
+        self.outbox.close()
+        await self.game.channel_pool.release(self.channel, self.user)
     
-    async def send_message(self, content):
+    async def send_message(self, content, flush=False):
         '''
-        Sends given message to the player as a Discord message on their private channel
+        Sends given message to the player as a Discord message on their private channel.
+        Messages sent close together are merged into as few Discord messages as possible.
         INPUT
             content; string message to send to the player
+            flush; boolean whether to wait until this and all earlier messages are delivered, raising the error if a send failed
         '''
-        await self.channel.send(content) 
+        self.outbox.queue(content)
+        if flush:
+            await self.outbox.flush()
         return
     
     async def handle_message(self, message):
@@ -1,14 +1,18 @@
 """
 Game states/phases: Creation, Questioning, Guess, Trial
 """
-import numpy as np
-from nltk.stem.snowball import SnowballStemmer
-from time import time
+import asyncio
+from time import monotonic
 import math
 import random
-import re
 import player_roles as pr
+import keyword_deck
+import word_match
+import word_distribution
 from gpt_responder import GptWitness
+from messaging import fan_out, run_for_each
+from scheduler import SCHEDULER
+from event_log import log_event
 
 # Limit the maximum characters in WITNESS question and responses. Saves OpenAI API costs.
 MAX_LIMITS = {"wordsperplayer" : 4,
@@ -16,6 +20,9 @@ MAX_LIMITS = {"wordsperplayer" : 4,
               "numbannedwords" : 20}
 MIN_LIMITS = {"questioncooldown" : 15}
 
+# Seconds before a phase's time limit at which players are reminded
+REMINDER_SECONDS = 30
+
 class GameState:
     '''
     Parent class for each game state.
@@ -23,9 +30,11 @@ class GameState:
     '''    
     
     game = None                 # The Game object for this game state
-    start = None                # The time() call at the start of this game state
+    start = None                # The monotonic() call at the start of this game state
     time_limit = None           # Integer number of seconds for this phase's time limit
     phase_end_message = None    # String message to send to all players when this phase's time limit is reached
+    timers = None               # List of TimerHandle objects for this phase's deadline and reminders
+    proceeding = None           # Boolean whether this phase has started moving the game on to the next phase
 
     async def initialize(game):
         '''
@@ -46,28 +55,77 @@ class GameState:
         '''
         self = gamestate_instance
         self.game = game
-        self.start = time()
+        self.start = monotonic()
+        self.timers = []
+        if game.gamestate is not None:
+            game.gamestate.cancel_timers()
         self.time_limit = 3600
         self.phase_end_message = f"**This phase's time limit ({math.floor(self.time_limit)}sec) has been reached! If you had a task but did not submit an entry, your task will be ignored.**"
         return self
 
+    def start_timer(self):
+        '''
+        Schedules this phase's time limit, and a reminder shortly before it
+        '''
+        deadline = self.start + self.time_limit
+        self.timers.append(SCHEDULER.call_at(deadline, self.on_deadline))
+        if self.time_limit > REMINDER_SECONDS:
+            self.timers.append(SCHEDULER.call_at(deadline - REMINDER_SECONDS, self.on_reminder))
+
+    def cancel_timers(self):
+        '''
+        Cancels this phase's scheduled deadline and reminders
+        '''
+        for timer in self.timers:
+            timer.cancel()
+        self.timers = []
+
+    def begin_proceed(self):
+        '''
+        Claims the move to the next phase and cancels this phase's timers.
+        A deadline, vote or command may all try to end a phase while another is still awaiting, so only the first one proceeds.
+        RETURNS
+            boolean whether the caller should proceed; False if this phase is no longer current or is already proceeding
+        '''
+        if self.proceeding or self.game.gamestate is not self:
+            return False
+        self.proceeding = True
+        self.cancel_timers()
+        return True
+
+    def get_remaining_time(self):
+        '''
+        RETURNS integer number of seconds remaining in this phase
+        '''
+        return max(0, math.floor(self.time_limit - monotonic() + self.start))
+
+    async def on_reminder(self):
+        '''
+        Reminds all players that this phase's time limit is near
+        '''
+        if self.game.gamestate is self:
+            await self.game.send_global_message(f"**{self.get_remaining_time()} seconds remaining in this phase.**", flush=True)
+
+    async def on_deadline(self):
+        '''
+        Moves to the next GameState when this phase's time limit is reached
+        '''
+        if self.game.gamestate is self:
+            await self.game.send_global_message(self.phase_end_message, flush=True)
+            await self.proceed()
+            self.game.save_snapshot(phase_changed=True)
+
     async def handle_message(self, message):
         '''
         Handles the input message
         INPUT
             message; Discord Message object to handle
         '''
-        # If time limit is reached, then move to next GameState
-        if time() - self.start > self.time_limit:
-            await self.game.send_global_message(self.phase_end_message)
-            await self.proceed()
-            return "PROCEED"
-        
-        # Otherwise, have the sender's Player object handle the message
-        for ply in self.game.player_list:
-            if message.author.id == ply.user.id:
-                await ply.handle_message(message)
-                return
+        # Have the sender's Player object handle the message
+        ply = self.game.get_player(message.author.id)
+        if ply is not None:
+            await ply.handle_message(message)
+            return
             
     async def conclude(self):
         '''
@@ -109,13 +167,64 @@ class GameStateCreation(GameState):
     Game creation. The game host adjusts game settings before gameplay begins
     '''
 
+    prewarm_task = None     # asyncio.Task that picks the next keyword and builds its GptWitness in the background
+    keyword_task = None     # asyncio.Task that draws the next keyword once, shared by every prewarm of this Creation phase
+
     async def initialize(game):
         '''
         RETURNS this intialized GameState object
         INPUT
             game; Game object
         '''
-        return await GameState.initialize_helper(game, GameStateCreation())
+        self = await GameState.initialize_helper(game, GameStateCreation())
+        self.start_prewarm()
+        return self
+
+    def start_prewarm(self):
+        '''
+        Starts (or restarts) fetching the keyword's banned words in the background.
+        The keyword is drawn only once, so restarting after a settings change does not use up keywords from the deck.
+        It is drawn again only if drawing it failed.
+        '''
+        if self.prewarm_task is not None:
+            self.prewarm_task.cancel()
+        task = self.keyword_task
+        if task is None or task.cancelled() or (task.done() and task.exception() is not None):
+            self.keyword_task = asyncio.create_task(self.get_random_word())
+        self.prewarm_task = asyncio.create_task(self.prewarm())
+
+    async def prewarm(self):
+        '''
+        RETURNS tuple of the next keyword, its GptWitness, and its MatchSignature for checking guesses
+        '''
+        keyword = await asyncio.shield(self.keyword_task)
+        signature = word_match.match_signature(keyword)
+        witness = await GptWitness.initialize(self.game,
+                                              keyword,
+                                              self.game.settings["numbannedwords"])
+        return keyword, witness, signature
+
+    async def get_prewarmed(self):
+        '''
+        RETURNS tuple of the next keyword, its GptWitness and its MatchSignature, waiting for the background task if it is still running
+        Redoes the background task if the settings changed since it started or if it failed
+        '''
+        while True:
+            task = self.prewarm_task
+            if task is None or task.cancelled() or (task.done() and task.exception() is not None):
+                self.start_prewarm()
+                task = self.prewarm_task
+            try:
+                keyword, witness, signature = await task
+            except asyncio.CancelledError:
+                # The prewarm was restarted by a settings change while we waited. Wait for the new one.
+                if asyncio.current_task().cancelling():
+                    raise
+                continue
+            if witness.n_words == self.game.settings["numbannedwords"]:
+                return keyword, witness, signature
+            if self.prewarm_task is task:
+                self.prewarm_task = None
 
     async def handle_message(self, message):
         '''
@@ -143,10 +252,12 @@ class GameStateCreation(GameState):
                     return
                 if split_msg[1] == "add":
                     self.game.settings["specialroles"].add(split_msg[2])
+                    log_event("settings", self.game, role_added=split_msg[2])
                     await self.game.send_global_message(f"Host added role `{split_msg[2]}`.")
                     return
                 else:
                     self.game.settings["specialroles"].discard(split_msg[2])
+                    log_event("settings", self.game, role_removed=split_msg[2])
                     await self.game.send_global_message(f"Host removed role `{split_msg[2]}`.")
                     return
 
@@ -172,6 +283,9 @@ class GameStateCreation(GameState):
 
                     # Set new setting
                     self.game.settings[setting_name] = found_int
+                    log_event("settings", self.game, **{setting_name: found_int})
+                    if setting_name == "numbannedwords":
+                        self.start_prewarm()
                     await self.game.send_global_message(f"Game host set {setting_name} to {found_int}.")
                 else:
                     await self.game.player_list[0].send_message(f"Invalid setting. See `$showsettings` for help. Change settings by `$<settingname> <integer value>`.")
@@ -200,12 +314,13 @@ class GameStateCreation(GameState):
         # Handle player leaving the game
         if message.content == "$leavegame":
             new_host = (message.author.id == self.game.player_list[0].user.id)
-            for ply in self.game.player_list:
-                if ply.user.id == message.author.id:
-                    self.game.player_list.remove(ply)
-                    await self.game.send_global_message(f"`{ply.user.name}` left the game. There are now {len(self.game.player_list)} players.")
-                    await ply.channel.delete()
-            if new_host:
+            ply = self.game.get_player(message.author.id)
+            if ply is not None:
+                self.game.remove_player(ply)
+                log_event("leave", self.game, user=ply.user.id)
+                await self.game.send_global_message(f"`{ply.user.name}` left the game. There are now {len(self.game.player_list)} players.")
+                await ply.release_private_channel()
+            if new_host and self.game.player_list:
                 await self.game.send_game_creation_message()
             return
                 
@@ -214,14 +329,21 @@ class GameStateCreation(GameState):
         Changes the Game's game state to Questioning
         Assigns a role to each player
         '''
+        if not self.begin_proceed():
+            return
+        started = monotonic()
+
+        # Get keyword and GPT Responder, prepared in the background during Creation
+        try:
+            self.game.keyword, self.game.gpt_witness, self.game.keyword_signature = await self.get_prewarmed()
+        except Exception as e:
+            print(f"Failed to prepare the keyword in {self.game.category}: {e!r}")
+            self.proceeding = False
+            await self.game.player_list[0].send_message("The game couldn't be prepared. Use `$start` to try again.")
+            return
 
-        # Get keyword
-        self.game.keyword = self.get_random_word()
-
-        # Build GPT Responder
-        self.game.gpt_witness = GptWitness(self.game,
-                                           self.game.keyword,
-                                           self.game.settings["numbannedwords"])
+        # Start this game's OpenAI usage from the banned words of its WITNESS. Prewarms that were thrown away are not counted.
+        self.game.usage = dict(self.game.gpt_witness.usage or {})
 
         # Randomized list of players for role assignment
         temp_player_list = self.game.player_list.copy()
@@ -230,28 +352,29 @@ class GameStateCreation(GameState):
         # Assign special roles
         for title in self.game.settings["specialroles"]:
             ply = temp_player_list.pop()
-            ply.role = await pr.role_builder(ply, title)
+            ply.role = pr.role_builder(ply, title)
 
         # Assign civilians
         while temp_player_list:
             ply = temp_player_list.pop()
-            ply.role = await pr.role_builder(ply, "Civilian")
+            ply.role = pr.role_builder(ply, "Civilian")
         
-        # Send intro messages
-        for ply in self.game.player_list:
-            await ply.role.send_team_introduction_message()
+        # Send intro messages to all players at once
+        log_event("roles", self.game, keyword=self.game.keyword,
+                  roles={ply.user.id: ply.role.title for ply in self.game.player_list})
+        await run_for_each(self.game.player_list, lambda ply: ply.role.send_introduction())
 
         # Move to Questioning phase
         self.game.gamestate = await GameStateQuestion.initialize(self.game)
+        self.game.start_latency = monotonic() - started
+        print(f"{self.game.category} reached Questioning {self.game.start_latency:.3f}sec after $start.")
         return
     
-    def get_random_word(self):
+    async def get_random_word(self):
         '''
-        RETURNS a random word from pictionary_words.txt
+        RETURNS the next word from this guild's shuffled deck of pictionary_words.txt
         '''
-        with open("pictionary_words.txt") as f:
-            words = f.readlines()
-        keyword = random.choice(words).strip()
+        keyword = await keyword_deck.draw_keyword(self.game.category.guild.id)
         print(f"'{keyword}'")
         return keyword
 
@@ -260,7 +383,7 @@ class GameStateQuestion(GameState):
     Questioning phase. Players take turns questioning the WITNESS about the keyword.
     '''
 
-    previous_guess_time = None  # The time() seconds of the most recent guess
+    previous_guess_time = None  # The monotonic() seconds of the most recent guess
 
     async def initialize(game):
         '''
@@ -281,7 +404,8 @@ class GameStateQuestion(GameState):
         # Set initial questioner
         self.game.questioner = random.randrange(len(self.game.player_list))
         await self.send_questioner_instructions()
-        self.previous_guess_time = time()
+        self.previous_guess_time = monotonic()
+        self.start_timer()
 
         return self
     
@@ -289,6 +413,8 @@ class GameStateQuestion(GameState):
         '''
         Changes the Game's game state to Guess
         '''
+        if not self.begin_proceed():
+            return
         self.game.gamestate = await GameStateGuess.initialize(self.game)
 
     async def handle_message(self, message):
@@ -297,10 +423,8 @@ class GameStateQuestion(GameState):
         INPUT
             message; Discord Message object to handle
         '''
-        # Check that the time limit has not passed
-        flag = await super().handle_message(message)
-        if flag and flag == "PROCEED":
-            return
+        # Let the sender's role handle the message
+        await super().handle_message(message)
 
         # Check for questioner message
         if message.author.id == (self.game.get_questioner()).user.id:
@@ -316,7 +440,7 @@ class GameStateQuestion(GameState):
             if len(split_msg) >= 2 and split_msg[0] == "$ask":
                 
                 # Check for question frequency cooldown
-                if time() - self.previous_guess_time < MIN_LIMITS["questioncooldown"]:
+                if monotonic() - self.previous_guess_time < MIN_LIMITS["questioncooldown"]:
                     await (self.game.get_questioner()).send_message(f"You're asking questions too quickly! Wait {MIN_LIMITS['questioncooldown']} seconds between questions.")
                     return
                 
@@ -328,20 +452,31 @@ class GameStateQuestion(GameState):
                 # Record question and answer
                 question = " ".join(split_msg[1:])
 
-                witness_response = await self.game.gpt_witness.ask(question)
+                try:
+                    witness_response = await self.game.gpt_witness.ask(question)
+                except Exception as e:
+                    print(f"WITNESS failed to answer in {self.game.category}: {e!r}")
+                    await (self.game.get_questioner()).send_message("The WITNESS didn't answer. Please ask your question again.")
+                    return
+
+                # The time limit or $readytoguess may have ended questioning while the WITNESS answered
+                if self.game.gamestate is not self or self.proceeding:
+                    return
+                log_event("ask", self.game, questioner=(self.game.get_questioner()).user.id,
+                          question=self.game.gpt_witness.witness_questions[-1], response=witness_response)
                 witness_words = witness_response.split()
                 # self.game.gpt_witness.witness_responses.append((self.game.get_questioner()).user.name + ": " + witness_response)
-                self.previous_guess_time = time()
+                self.previous_guess_time = monotonic()
 
-                # Shuffle response
-                random.shuffle(witness_words)
-                if "Censorer" in self.game.powers.keys() and len(self.game.player_list) <= len(witness_words):
-                    split_response = [[word] for word in witness_words[:len(self.game.player_list)]]
+                # Shuffle response and deal it among the players
+                censored = "Censorer" in self.game.powers.keys() and len(self.game.player_list) <= len(witness_words)
+                split_response = word_distribution.deal(witness_words, len(self.game.player_list), censor=censored)
+                if censored:
                     await self.game.send_global_message("The villainous **Censorer** has muddled the WITNESS response! Everyone only observes one word this round.")
-                else:
-                    split_response = np.array_split(np.array(witness_words), len(self.game.player_list))
                 
                 # Distribute response to players
+                messages = {}
+                observed = {}
                 for ply in self.game.player_list:
                     observed_words = split_response.pop()
                     msg = f"`{(self.game.get_questioner()).user.name}` questioned the WITNESS."
@@ -349,8 +484,11 @@ class GameStateQuestion(GameState):
                     msg += "You observed the following words."
                     for word in observed_words:
                         msg += f"\n\t**{word}**"
-                    msg += "\n" + f"There are {math.floor(self.game.gamestate.time_limit - time() + self.game.gamestate.start)} of {self.game.gamestate.time_limit} seconds remaining."
-                    await ply.send_message(msg)    
+                    msg += "\n" + f"There are {self.get_remaining_time()} of {self.time_limit} seconds remaining."
+                    messages[ply] = msg
+                    observed[ply.user.id] = list(observed_words)
+                log_event("words", self.game, words=observed)
+                await fan_out(self.game.player_list, messages.get)
                 
                 # Rotate to new questioner and reset power activations
                 self.game.questioner = (self.game.questioner + 1) % len(self.game.player_list)
@@ -386,6 +524,7 @@ class GameStateGuess(GameState):
         await (self.game.get_questioner()).send_message("Use command `$guess <your guess>` to make your guess.")
         for ply in self.game.player_list:
             await ply.role.guess_action()
+        self.start_timer()
         return self
     
     async def proceed(self, go_to_trial=True):
@@ -394,6 +533,8 @@ class GameStateGuess(GameState):
         INPUT
             go_to_trial; boolean whether to move game state to Trial; else concludes the game and starts new game at Creation
         '''
+        if not self.begin_proceed():
+            return
         if go_to_trial:
             self.game.gamestate = await GameStateTrial.initialize(self.game)
         else:
@@ -405,30 +546,27 @@ class GameStateGuess(GameState):
         INPUT
             message; Discord Message object to handle
         '''
-        # Check that the time limit has not passed
-        flag = await super().handle_message(message)
-        if flag and flag == "PROCEED":
-            return
+        # Let the sender's role handle the message
+        await super().handle_message(message)
 
         # Check for a keyword guess
         split_msg = message.content.split()
-        if split_msg[0] == "$guess" and message.author.id == (self.game.get_questioner()).user.id:
+        if len(split_msg) >= 2 and split_msg[0] == "$guess" and message.author.id == (self.game.get_questioner()).user.id:
             
-            guess = split_msg[1].lower()
+            guess = " ".join(split_msg[1:]).lower()
+            signature = self.game.keyword_signature
 
             # Check if guess has same number of words as keyword
-            if len(guess.split()) != len(self.game.keyword.split()):
-                await (self.game.get_questioner()).send_message(f"Your guess for the keyword contained {len(guess.split())} word(s), but the keyword is made of {len(self.game.keyword.split())} word(s) (separated by spaces).")
+            guess_words = len(word_match.normalize(guess))
+            if guess_words != len(signature.tokens):
+                await (self.game.get_questioner()).send_message(f"Your guess for the keyword contained {guess_words} word(s), but the keyword is made of {len(signature.tokens)} word(s) (separated by spaces).")
                 return
             
-            # Check if guess and keyword have the same English roots (stems). If so, then correct.
+            # Check if guess and keyword have the same words, English roots (stems) or singular forms. If so, then correct.
             await self.game.send_global_message(f"Questioner {(self.game.get_questioner()).user.name} guessed **{guess}**. The correct keyword is **{self.game.keyword}**.")
-            stemmer = SnowballStemmer("english")
-            guess_stems = [stemmer.stem(re.sub(r'[^a-zA-Z]', '', word.lower()))
-                            for word in guess.split()]
-            true_stems = [stemmer.stem(re.sub(r'[^a-zA-Z]', '', word.lower()))
-                            for word in self.game.keyword.split()]
-            if guess_stems == true_stems:
+            correct = word_match.matches(guess, signature)
+            log_event("guess", self.game, questioner=message.author.id, guess=guess, correct=correct)
+            if correct:
                 await self.game.send_global_message(":white_check_mark: The Questioner guessed **correctly**. The Civilians win!")
                 await self.proceed(go_to_trial=False)
             else:
@@ -457,6 +595,7 @@ class GameStateTrial(GameState):
         await self.game.send_global_message(f":ballot_box: Everyone has {self.time_limit} seconds to vote for a player to convict. The Civilians win if the player with/tied for the most votes is a Villain. You can vote exactly once. You can change your vote as long as the time limit has not been reached and at least one player has not voted. Type (or copy/paste) the name of the player you want to vote for:" + "".join(suspects))
         for ply in self.game.player_list:
             await ply.role.trial_action()
+        self.start_timer()
         return self
     
     async def proceed(self):
@@ -464,35 +603,32 @@ class GameStateTrial(GameState):
         Counts votes and reports if a Villain was convicted
         Concludes the game and starts a new game at the GameStateCreation gamestate
         '''
+        if not self.begin_proceed():
+            return
         # Count the votes
-        vote_dict = {} # dictionary maps each suspect's name to a list of player names that voted for that suspect
-        for accuser in self.votes.keys():
-            suspect = self.votes[accuser]
-            if suspect is not None:
-                if suspect not in vote_dict.keys():
-                    vote_dict[suspect] = [accuser]
-                else:
-                    vote_dict[suspect].append(accuser)
+        vote_dict, convicted = tally_votes(self.votes)
 
         # Report final vote tally
         msg = "Here is the final vote tally:"
-        for key in vote_dict.keys():
-            msg += (f"\n`{key}` was suspected by "
-                    + ", ".join([f"`{accusers}`"
-                                 for accusers in vote_dict[key]]))
+        for suspect, accusers in vote_dict.items():
+            msg += (f"\n`{suspect}` was suspected by "
+                    + ", ".join([f"`{accuser}`"
+                                 for accuser in accusers]))
+        if not vote_dict:
+            msg += "\nNobody voted before the time limit."
         await self.game.send_global_message(msg)
         
         # Report who was convicted
-        max_votes = max([len(accusers) for accusers in vote_dict.values()])
-        convicted = [suspect for suspect in vote_dict.keys()
-                     if len(vote_dict[key]) == max_votes]
-        await self.game.send_global_message(":link: The following players were convicted: "
-                                            + ", ".join([f"`{suspect}`"
-                                                         for suspect in convicted]))
+        if convicted:
+            await self.game.send_global_message(":link: The following players were convicted: "
+                                                + ", ".join([f"`{suspect}`"
+                                                             for suspect in convicted]))
+        else:
+            await self.game.send_global_message(":link: Nobody was convicted.")
 
         # Report if any Villains were convicted
         guilty = set(convicted).intersection([ply.user.name for ply in self.game.player_list
-                                              if isinstance(ply.role, pr.RoleVillain)])
+                                              if ply.role.get_team() == "Villain"])
         if guilty:
             await self.game.send_global_message(":cop: **Congratulations, Civilians!** The following Villains were convicted: "
                                                 + ", ".join([f"`{suspect}`" for suspect in guilty]))
@@ -507,21 +643,37 @@ class GameStateTrial(GameState):
         INPUT
             message; Discord Message object to handle
         '''
-        # Check that the time limit has not passed
-        flag = await super().handle_message(message)
-        if flag and flag == "PROCEED":
-            return
+        # Let the sender's role handle the message
+        await super().handle_message(message)
 
         # Check if the message author and suspect are both players in this game
-        for accuser in self.game.player_list:
-            if accuser.user.name == message.author.name:
-                if message.content in [suspect.user.name for suspect in self.game.player_list]:
+        accuser = self.game.get_player(message.author.id)
+        if accuser is not None and self.game.get_player_by_name(message.content) is not None:
                     
-                    # Record the vote
-                    self.votes[accuser.user.name] = message.content
-                    await accuser.send_message(f"You voted for `{message.content}`.")
-                    if len(self.votes.keys()) == len(self.game.player_list):
-                        await self.proceed()
-                    return
-
+            # Record the vote
+            self.votes[accuser.user.name] = message.content
+            log_event("vote", self.game, accuser=accuser.user.id, suspect=message.content)
+            await accuser.send_message(f"You voted for `{message.content}`.")
+            if len(self.votes.keys()) == len(self.game.player_list):
+                await self.proceed()
+            return
 
+def tally_votes(votes):
+    '''
+    Counts the Trial votes
+    INPUT
+        votes; dictionary mapping each player's name to the name of the player they vote for
+    RETURNS
+        dictionary mapping each suspect's name to the list of player names that voted for that suspect
+        list of the names of the suspects with/tied for the most votes
+    '''
+    vote_dict = {}
+    for accuser, suspect in votes.items():
+        if suspect is not None:
+            vote_dict.setdefault(suspect, []).append(accuser)
+    if not vote_dict:
+        return vote_dict, []
+    max_votes = max(len(accusers) for accusers in vote_dict.values())
+    convicted = [suspect for suspect, accusers in vote_dict.items()
+                 if len(accusers) == max_votes]
+    return vote_dict, convicted
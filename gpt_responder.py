@@ -2,15 +2,65 @@
 GptWitness object lets Sheriff ask questions to the WITNESS via GPT-3.5 Turbo.
 """
 
-import openai
+import asyncio
 import re
 import os
 from dotenv import load_dotenv
 import player_roles as pr
+import word_cache
+import usage
+from answer_cache import ANSWER_CACHE, make_key
 
-# Get OpenAI API key
+# Take environment variables from .env
 load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
+
+# Maximum number of OpenAI requests in flight at once across all games
+MAX_CONCURRENT_REQUESTS = int(os.getenv("OPENAI_MAX_CONCURRENCY", 4))
+
+# Seconds to wait for an OpenAI response before giving up. OPENAI_API_BASE selects the server, e.g. fake_openai.py.
+REQUEST_TIMEOUT = float(os.getenv("OPENAI_REQUEST_TIMEOUT", 30))
+
+# Maximum completion tokens for WITNESS answers and for banned word lists
+ASK_MAX_TOKENS = int(os.getenv("OPENAI_ASK_MAX_TOKENS", 120))
+BANNED_WORDS_MAX_TOKENS = int(os.getenv("OPENAI_BANNED_WORDS_MAX_TOKENS", 25))
+
+_request_slots = None   # asyncio.Semaphore limiting concurrent OpenAI requests, created on first use
+_openai = None          # The openai module, imported on first use
+
+def get_openai():
+    '''
+    RETURNS the openai module, importing it and setting the API key on first use
+    '''
+    global _openai
+    if _openai is None:
+        import openai
+        openai.api_key = os.getenv("OPENAI_API_KEY")
+        _openai = openai
+    return _openai
+
+async def create_chat_completion(**kwargs):
+    '''
+    Awaits an OpenAI ChatCompletion without blocking the event loop.
+    At most MAX_CONCURRENT_REQUESTS completions are in flight at once; further callers wait their turn.
+    Each completion times out after REQUEST_TIMEOUT seconds.
+    INPUT
+        kwargs; keyword arguments passed to openai.ChatCompletion.acreate
+    RETURNS
+        the OpenAI response object
+    '''
+    global _request_slots
+    if _request_slots is None:
+        _request_slots = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    async with _request_slots:
+        return await get_openai().ChatCompletion.acreate(request_timeout=REQUEST_TIMEOUT, **kwargs)
+
+def load_system_instructions():
+    '''
+    RETURNS the string system-level prompt for WITNESS answers
+    '''
+    with open("GPT System Instructions.txt") as f:
+        lines = f.readlines()
+    return "".join(lines)
 
 class GptWitness:
     '''
@@ -26,28 +76,31 @@ class GptWitness:
 
     witness_questions = None    # List of the question strings asked to the witness
     witness_responses = None    # List of the response strings provided by the witness
+    usage = None                # Dictionary mapping call type to the usage.UsageCounter of the calls made to build this witness,
+                                # counted towards the game that uses it when that game starts
 
-    def __init__(self, game, keyword, n_words, verbose=True):
+    async def initialize(game, keyword, n_words, verbose=True):
         '''
-        Initializes this Witness
+        RETURNS this initialized Witness
         INPUT
             game; the associated Game() instance
             keyword; string keyword
             n_words; target number of words for GPT output
             verbose; boolean whether to print results to terminal
         '''
+        self = GptWitness()
         self.game = game
         self.keyword = keyword
         self.n_words = n_words
         self.verbose = verbose
-        self.banned_words = self.get_banned_words()
+        self.usage = {}
+        self.banned_words = await self.get_banned_words()
         self.witness_questions = []
         self.witness_responses = []
         
         # Load in system instructions
-        with open("GPT System Instructions.txt") as f:
-            lines = f.readlines()
-        self.system_instructions = "".join(lines)
+        self.system_instructions = load_system_instructions()
+        return self
 
     async def ask(self, question):
         '''
@@ -71,22 +124,39 @@ class GptWitness:
         self.witness_questions.append(question)
         prompt = self.make_prompt(question)
 
-        # Get GPT response
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            max_tokens=120,
-            messages=[
-                    {"role": "system", "content": self.system_instructions},
-                    {"role": "user", "content": prompt}
-                ]
-        )
-        answer = response["choices"][0]["message"]["content"]
+        # Get GPT response, reusing a cached answer to the same question if there is one
+        cache_key = make_key(self.keyword, question, self.n_words, self.banned_words)
+        answer = ANSWER_CACHE.get(cache_key)
+        if answer is None:
+            try:
+                response = await create_chat_completion(
+                    model="gpt-3.5-turbo",
+                    max_tokens=ASK_MAX_TOKENS,
+                    messages=[
+                            {"role": "system", "content": self.system_instructions},
+                            {"role": "user", "content": prompt}
+                        ]
+                )
+            except Exception:
+                # Forget the unanswered question so questions and responses stay paired
+                self.witness_questions.pop()
+                raise
+            answer = response["choices"][0]["message"]["content"]
+            ANSWER_CACHE.put(cache_key, answer)
+            usage.record(self.game, "ask", response["usage"], ASK_MAX_TOKENS, self.n_words)
+
+            # Print if verbose
+            if self.verbose:
+                print(response["usage"])
+        else:
+            usage.record(self.game, "ask", None, ASK_MAX_TOKENS, self.n_words)
+            if self.verbose:
+                print(f"Answer cache hit. {ANSWER_CACHE.stats()}")
         self.witness_responses.append(answer)
 
         # Print if verbose
         if self.verbose:
             print(answer)
-            print(response["usage"])
         
         # Check for Reporter triggers
         if len(self.game.powers.keys()) > 0:
@@ -122,38 +192,58 @@ class GptWitness:
             print(prompt)
         return prompt
         
-    def get_banned_words(self):
+    async def get_banned_words(self):
         '''
-        Returns list of words similar to the keyword. Generates this list using OpenAI API.
+        Returns list of words similar to the keyword. Uses the banned words cache, else generates this list using OpenAI API.
         RETURNS
             list of string words that are similar to the keyword. Target length is self.n_words.
         '''
-        # Get the GPT prompt
-        with open("GPT Related Words.txt") as f:
-            lines = f.readlines()
-        instruct = "".join(lines)
-
-        # Get the GPT response
-        prompt = f'Keyword: "{self.keyword}". Word count: {self.n_words}.'
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            max_tokens=25,
-            messages=[
-                    {"role": "system", "content": instruct},
-                    {"role": "user", "content": prompt}
-                ]
-        )
-        answer = response["choices"][0]["message"]["content"]
-
-        # Clean the banned words
-        pattern = r"[^a-zA-Z\s]"
-        words = answer.lower()
-        words = re.sub(pattern, "", words)
-
-        # Print to terminal if verbose
-        if self.verbose:
-            print(answer)
-            
-        return words.split()
-
-
+        cache = word_cache.get_cache()
+        words = await cache.aget(self.keyword, self.n_words)
+        if words is None:
+            words = await generate_banned_words(self.keyword, self.n_words, self.verbose, self.game, self.usage)
+            await cache.aput(self.keyword, self.n_words, words)
+        else:
+            usage.record(self.game, "banned_words", None, BANNED_WORDS_MAX_TOKENS, self.n_words, self.usage)
+        return words
+
+async def generate_banned_words(keyword, n_words, verbose=True, game=None, counters=None):
+    '''
+    Generates a list of words similar to the keyword using OpenAI API.
+    INPUT
+        keyword; string keyword
+        n_words; target number of banned words
+        verbose; boolean whether to print results to terminal
+        game; Game object to count the token usage towards, or None outside a game
+        counters; dictionary of usage.UsageCounter objects to count the call towards instead of game.usage, or None
+    RETURNS
+        list of string words that are similar to the keyword
+    '''
+    # Get the GPT prompt
+    with open("GPT Related Words.txt") as f:
+        lines = f.readlines()
+    instruct = "".join(lines)
+
+    # Get the GPT response
+    prompt = f'Keyword: "{keyword}". Word count: {n_words}.'
+    response = await create_chat_completion(
+        model="gpt-3.5-turbo",
+        max_tokens=BANNED_WORDS_MAX_TOKENS,
+        messages=[
+                {"role": "system", "content": instruct},
+                {"role": "user", "content": prompt}
+            ]
+    )
+    answer = response["choices"][0]["message"]["content"]
+    usage.record(game, "banned_words", response["usage"], BANNED_WORDS_MAX_TOKENS, n_words, counters)
+
+    # Clean the banned words
+    pattern = r"[^a-zA-Z\s]"
+    words = answer.lower()
+    words = re.sub(pattern, "", words)
+
+    # Print to terminal if verbose
+    if verbose:
+        print(answer)
+        
+    return words.split()
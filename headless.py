@@ -0,0 +1,458 @@
+"""
+Headless game engine for load testing and profiling.
+Runs the real Game and GameState code against in-memory stand-ins for Discord objects and a stubbed WITNESS,
+with scripted bots playing complete games, so many games can be played per second on one core.
+
+    python headless.py --games 2000 --players 6 --roles villain,detective
+    python headless.py --games 500 --profile
+
+install() points the game modules at the stand-ins, a temporary database and a temporary event log,
+with snapshots and keyword deck persistence off. uninstall() puts everything back.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import cProfile
+import io
+import itertools
+import os
+import pstats
+import random
+import sys
+import tempfile
+from time import perf_counter
+
+_ids = itertools.count(1000)    # Source of unique fake Discord ids
+
+class FakeUser:
+    '''
+    Stand-in for a Discord User.
+    '''
+
+    def __init__(self, name):
+        self.id = next(_ids)
+        self.name = name
+        self.mention = f"<@{self.id}>"
+
+    def __repr__(self):
+        return self.name
+
+class FakeMessage:
+    '''
+    Stand-in for a Discord Message.
+    '''
+
+    def __init__(self, content, author=None, channel=None):
+        self.id = next(_ids)
+        self.content = content
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild if channel is not None else None
+
+    async def add_reaction(self, emoji):
+        return
+
+class FakeChannel:
+    '''
+    Stand-in for a Discord TextChannel. Keeps a count of the messages sent to it.
+    '''
+
+    def __init__(self, name, guild, category=None, overwrites=None):
+        self.id = next(_ids)
+        self.name = name
+        self.guild = guild
+        self.category = category
+        self.category_id = category.id if category is not None else None
+        self.overwrites = overwrites or {}
+        self.sent = 0
+        self.last_message = None
+
+    def __str__(self):
+        return self.name
+
+    async def send(self, content):
+        self.sent += 1
+        self.last_message = content
+        return FakeMessage(content, channel=self)
+
+    async def delete(self):
+        if self.category is not None and self in self.category.channels:
+            self.category.channels.remove(self)
+
+    async def edit(self, name=None, overwrites=None):
+        if name is not None:
+            self.name = name
+        if overwrites is not None:
+            self.overwrites = overwrites
+
+    async def set_permissions(self, target, overwrite=None):
+        if overwrite is None:
+            self.overwrites.pop(target, None)
+        else:
+            self.overwrites[target] = overwrite
+
+    async def purge(self, limit=None):
+        self.last_message = None
+        return []
+
+    def get_partial_message(self, message_id):
+        message = FakeMessage(None, channel=self)
+        message.id = message_id
+        return message
+
+class FakeCategory:
+    '''
+    Stand-in for a Discord CategoryChannel.
+    '''
+
+    def __init__(self, name, guild):
+        self.id = next(_ids)
+        self.name = name
+        self.guild = guild
+        self.channels = []
+
+    def __str__(self):
+        return self.name
+
+    async def create_text_channel(self, name, overwrites=None):
+        channel = FakeChannel(name, self.guild, self, overwrites)
+        self.channels.append(channel)
+        return channel
+
+    async def delete(self):
+        if self in self.guild.categories:
+            self.guild.categories.remove(self)
+
+class FakeGuild:
+    '''
+    Stand-in for a Discord Guild.
+    '''
+
+    def __init__(self, name="guild"):
+        self.id = next(_ids)
+        self.name = name
+        self.default_role = FakeUser("@everyone")
+        self.me = FakeUser("Witness")
+        self.categories = []
+        self.members = {}
+        self.lobby = FakeChannel("lobby", self)
+
+    async def create_category(self, name):
+        category = FakeCategory(name, self)
+        self.categories.append(category)
+        return category
+
+    def get_channel(self, channel_id):
+        if self.lobby.id == channel_id:
+            return self.lobby
+        for category in self.categories:
+            if category.id == channel_id:
+                return category
+            for channel in category.channels:
+                if channel.id == channel_id:
+                    return channel
+        return None
+
+    def get_member(self, user_id):
+        return self.members.get(user_id)
+
+def fake_completion(content, prompt_tokens=100, completion_tokens=20):
+    '''
+    RETURNS a dictionary shaped like an OpenAI ChatCompletion response
+    INPUT
+        content; string message content of the response
+        prompt_tokens; integer number of prompt tokens to report
+        completion_tokens; integer number of completion tokens to report
+    '''
+    return {"choices": [{"message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens,
+                      "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens}}
+
+async def fake_chat_completion(**kwargs):
+    '''
+    Stand-in for gpt_responder.create_chat_completion that answers instantly
+    '''
+    if kwargs.get("max_tokens", 0) <= 25:
+        return fake_completion("clue hint sign trace mark evidence")
+    return fake_completion("It is often found somewhere people gather and talk about many different things together")
+
+class StubWitness:
+    '''
+    Stand-in for the GptWitness that builds its banned words without OpenAI.
+    Questions still go through GptWitness.ask, so OpenAI requests go wherever create_chat_completion sends them.
+    '''
+
+    async def initialize(game, keyword, n_words, verbose=False):
+        '''
+        RETURNS a GptWitness for the keyword with placeholder banned words
+        INPUT
+            game; the associated Game() instance
+            keyword; string keyword
+            n_words; number of banned words
+            verbose; boolean whether to print results to terminal
+        '''
+        from gpt_responder import GptWitness, load_system_instructions
+        global _system_instructions
+        if _system_instructions is None:
+            _system_instructions = load_system_instructions()
+        self = GptWitness()
+        self.game = game
+        self.keyword = keyword
+        self.n_words = n_words
+        self.verbose = verbose
+        self.banned_words = [f"banned{i}" for i in range(n_words)]
+        self.usage = {}
+        self.witness_questions = []
+        self.witness_responses = []
+        self.system_instructions = _system_instructions
+        return self
+
+_system_instructions = None # String system-level prompt, read once for all StubWitness objects
+
+_installed = []     # List of (module or dictionary, name, original value) replaced by install(), in order
+
+def patch(target, name, value):
+    '''
+    Replaces a module attribute or dictionary item until uninstall()
+    INPUT
+        target; module or dictionary
+        name; string attribute name or dictionary key
+        value; replacement value
+    '''
+    if isinstance(target, dict):
+        _installed.append((target, name, target[name]))
+        target[name] = value
+    else:
+        _installed.append((target, name, getattr(target, name)))
+        setattr(target, name, value)
+
+def install(stub_openai=True, stub_witness=True, snapshots=False, persist_decks=False):
+    '''
+    Points the game modules at the headless stand-ins, until uninstall()
+    INPUT
+        stub_openai; boolean whether WITNESS questions are answered by fake_chat_completion instead of OpenAI
+        stub_witness; boolean whether banned words come from StubWitness instead of the banned words cache and OpenAI
+        snapshots; boolean whether games save snapshots
+        persist_decks; boolean whether keyword decks save their positions
+    RETURNS
+        string temporary directory holding the database and event log
+    '''
+    import gameplay     # Imported first, as gamestates and gpt_responder import each other through it
+    import gamestates as gs
+    import gpt_responder
+    import event_log
+    import keyword_deck
+    import messaging
+    import snapshots as snapshots_module
+    import storage
+    directory = tempfile.mkdtemp(prefix="witness-headless-")
+    patch(storage, "DB_PATH", os.path.join(directory, "witness.sqlite3"))
+    patch(event_log, "EVENT_LOG", event_log.EventLog(os.path.join(directory, "logs")))
+    patch(snapshots_module, "ENABLED", snapshots)
+    patch(keyword_deck, "PERSIST_DECKS", persist_decks)
+    patch(messaging, "OUTBOX_LINGER", 0)
+    if stub_openai:
+        patch(gpt_responder, "create_chat_completion", fake_chat_completion)
+    if stub_witness:
+        patch(gs, "GptWitness", StubWitness)
+
+    # Bots ask their questions back to back
+    patch(gs.MIN_LIMITS, "questioncooldown", 0)
+    return directory
+
+def uninstall():
+    '''
+    Undoes install()
+    '''
+    while _installed:
+        target, name, value = _installed.pop()
+        if isinstance(target, dict):
+            target[name] = value
+        else:
+            setattr(target, name, value)
+
+class Bot:
+    '''
+    Scripted players for one headless game.
+    '''
+
+    guild = None    # FakeGuild the game is played in
+    game = None     # The Game object being played
+    users = None    # List of FakeUser players, host first
+    rng = None      # random.Random used for the bots' choices
+    sent = None     # Number of messages the bots sent to the game
+    latencies = None    # Dictionary mapping each command ("$start", "$ask", ...) to the list of seconds the game took to handle it
+
+    def __init__(self, guild, n_players, rng=random):
+        self.guild = guild
+        self.users = [FakeUser(f"bot{next(_ids)}") for _ in range(n_players)]
+        self.rng = rng
+        self.sent = 0
+        self.latencies = {}
+
+    async def say(self, user, content):
+        '''
+        Sends a message from the given bot to its private channel, as Discord would deliver it to main.on_message
+        '''
+        ply = self.game.get_player(user.id)
+        self.sent += 1
+        started = perf_counter()
+        await self.game.handle_message(FakeMessage(content, user, ply.channel if ply is not None else None))
+        command = content.split()[0] if content.startswith("$") else "vote"
+        self.latencies.setdefault(command, []).append(perf_counter() - started)
+
+    def questioner(self):
+        return self.game.get_questioner().user
+
+    async def play(self, roles=(), questions=2, correct_rate=0.5):
+        '''
+        Plays one game from $play to its conclusion
+        INPUT
+            roles; iterable of string special role titles for the host to add
+            questions; number of questions to ask the WITNESS
+            correct_rate; probability that the questioner guesses the keyword
+        RETURNS
+            string name of the last phase reached before the game concluded
+        '''
+        import gameplay
+        import gamestates as gs
+        host = self.users[0]
+        self.game = await gameplay.Game.initialize(FakeMessage("$play", host, self.guild.lobby))
+        for user in self.users[1:]:
+            await self.game.add_player(user)
+
+        # Creation
+        for title in roles:
+            await self.say(host, f"$role add {title}")
+        await self.say(host, "$start")
+
+        # Questioning
+        for i in range(questions):
+            await self.say(self.questioner(), f"$ask what is clue number {i} for {host.name}")
+        await self.say(self.questioner(), "$readytoguess")
+
+        # Guess
+        if self.rng.random() < correct_rate:
+            guess = self.game.keyword
+        else:
+            guess = " ".join("nothing" for _ in self.game.keyword.split())
+        await self.say(self.questioner(), f"$guess {guess}")
+
+        # Trial
+        phase = "Guess"
+        if isinstance(self.game.gamestate, gs.GameStateTrial):
+            phase = "Trial"
+            names = [user.name for user in self.users]
+            for user in self.users:
+                await self.say(user, self.rng.choice(names))
+        return phase
+
+    async def close(self):
+        '''
+        Delivers the game's pending messages, ends the game and deletes its category
+        '''
+        if self.game is None:
+            return
+        for ply in self.game.player_list:
+            await ply.outbox.flush()
+            ply.outbox.close()
+        self.game.end()
+        await self.game.category.delete()
+
+def percentile(values, fraction):
+    '''
+    RETURNS the value at the given fraction (0 to 1) of the sorted values, or None if there are none
+    '''
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+async def run(n_games, n_players=6, roles=(), questions=2, concurrency=1, n_guilds=1, seed=None):
+    '''
+    Plays headless games with scripted bots
+    INPUT
+        n_games; number of games to play
+        n_players; number of bots in each game
+        roles; iterable of string special role titles to add to each game
+        questions; number of questions asked in each game
+        concurrency; number of games played at once
+        n_guilds; number of fake guilds the games are spread over
+        seed; seed for the bots' choices, or None
+    RETURNS
+        dictionary of results
+    '''
+    rng = random.Random(seed)
+    guilds = [FakeGuild(f"guild{i}") for i in range(n_guilds)]
+    phases = {"Guess": 0, "Trial": 0, "failed": 0}
+    counts = {"messages_in": 0, "messages_out": 0, "answered": 0}
+    latencies = {"$start": [], "$ask": []}
+    remaining = iter(range(n_games))
+
+    async def worker():
+        for i in remaining:
+            bot = Bot(guilds[i % n_guilds], n_players, rng)
+            try:
+                phases[await bot.play(roles, questions)] += 1
+            except Exception as e:
+                print(f"Game {i} failed: {e!r}")
+                phases["failed"] += 1
+            await bot.close()
+            counts["messages_in"] += bot.sent
+            if bot.game is not None:
+                counts["messages_out"] += sum(ply.channel.sent for ply in bot.game.player_list)
+                if bot.game.gpt_witness is not None:
+                    counts["answered"] += len(bot.game.gpt_witness.witness_responses)
+            for command, seconds in latencies.items():
+                seconds.extend(bot.latencies.get(command, []))
+
+    started = perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = perf_counter() - started
+    return {"games": n_games,
+            "seconds": elapsed,
+            "games_per_second": n_games / elapsed,
+            "ended_in_guess": phases["Guess"],
+            "ended_in_trial": phases["Trial"],
+            "failed": phases["failed"],
+            "questions_answered": counts["answered"],
+            "messages_in": counts["messages_in"],
+            "messages_out": counts["messages_out"],
+            "start_p50": percentile(latencies["$start"], 0.5),
+            "start_p95": percentile(latencies["$start"], 0.95),
+            "ask_p50": percentile(latencies["$ask"], 0.5),
+            "ask_p95": percentile(latencies["$ask"], 0.95)}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play Witness games headlessly with scripted bots.")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--players", type=int, default=6)
+    parser.add_argument("--roles", default="", help="comma-separated special roles to add to each game")
+    parser.add_argument("--questions", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=1, help="number of games played at once")
+    parser.add_argument("--guilds", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--profile", action="store_true", help="profile the run and print the top functions")
+    args = parser.parse_args()
+
+    # The game modules read their data files relative to the repository root
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    install()
+    roles = [title for title in args.roles.split(",") if title]
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        results = asyncio.run(run(args.games, args.players, roles, args.questions,
+                                  args.concurrency, args.guilds, args.seed))
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        uninstall()
+    for name, value in results.items():
+        print(f"{name}: {value:.4f}" if isinstance(value, float) else f"{name}: {value}")
+    if profiler is not None:
+        pstats.Stats(profiler, stream=sys.stdout).sort_stats("cumulative").print_stats(30)
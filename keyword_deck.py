@@ -0,0 +1,229 @@
+"""
+Keyword decks. Each guild draws keywords from its own shuffled deck of pictionary_words.txt,
+so a keyword only repeats once the whole deck has been drawn. Deck positions persist across restarts.
+
+If WITNESS_CORPUS names a binary corpus built by corpus.py, the decks are instead shuffled from its keywords,
+filtered by WITNESS_CORPUS_CATEGORY and WITNESS_CORPUS_DIFFICULTY when set.
+Setting WITNESS_PERSIST_DECKS=0 keeps decks in memory only, for example in headless load tests.
+"""
+
+import asyncio
+import os
+import random
+import storage
+from corpus import Corpus, CorpusView
+
+# Optional binary corpus to sample keywords from, and its default filters
+CORPUS_PATH = os.getenv("WITNESS_CORPUS")
+CORPUS_CATEGORY = os.getenv("WITNESS_CORPUS_CATEGORY")
+CORPUS_DIFFICULTY = int(os.getenv("WITNESS_CORPUS_DIFFICULTY")) if os.getenv("WITNESS_CORPUS_DIFFICULTY") else None
+
+# Whether deck positions are stored in the database
+PERSIST_DECKS = os.getenv("WITNESS_PERSIST_DECKS", "1") != "0"
+
+_corpus = None          # Tuple of all keywords, loaded on first use
+_large_corpus = None    # Corpus opened from CORPUS_PATH on first use
+_views = {}             # Dictionary mapping each (category, difficulty) filter to its CorpusView of the large corpus
+_decks = {}             # Dictionary mapping each guild id to its KeywordDeck
+
+def get_corpus():
+    '''
+    RETURNS tuple of all string keywords in pictionary_words.txt
+    '''
+    global _corpus
+    if _corpus is None:
+        with open("pictionary_words.txt") as f:
+            _corpus = tuple(line.strip() for line in f if line.strip())
+    return _corpus
+
+class Permutation:
+    '''
+    Seeded pseudorandom permutation of range(size), computed one position at a time by a Feistel network with cycle walking.
+    Decks over large corpora need no shuffled list: memory and time per draw do not grow with the corpus.
+    '''
+
+    ROUNDS = 4          # Number of Feistel rounds
+
+    size = None         # Number of indices permuted
+    half_bits = None    # Number of bits in each half of the Feistel block, which covers at least size values
+    mask = None         # Bit mask of one half
+    keys = None         # List of integer round keys derived from the seed
+
+    def __init__(self, size, seed):
+        '''
+        Initializes this permutation
+        INPUT
+            size; integer number of indices to permute
+            seed; integer seed choosing the permutation
+        '''
+        self.size = size
+        self.half_bits = max(1, (max(size - 1, 1).bit_length() + 1) // 2)
+        self.mask = (1 << self.half_bits) - 1
+        rng = random.Random(seed)
+        self.keys = [rng.getrandbits(32) for _ in range(self.ROUNDS)]
+
+    def __len__(self):
+        return self.size
+
+    def mix(self, value, key):
+        '''
+        RETURNS the Feistel round function of one half and a round key, a half-sized integer
+        '''
+        value = (value * 0x9E3779B1 + key) & 0xFFFFFFFF
+        value ^= value >> 15
+        value = (value * 0x2C1B3C6D) & 0xFFFFFFFF
+        value ^= value >> 12
+        return value & self.mask
+
+    def encrypt(self, value):
+        '''
+        RETURNS the image of the value under the Feistel network, a bijection on range(2 ** (2 * half_bits))
+        '''
+        left, right = value >> self.half_bits, value & self.mask
+        for key in self.keys:
+            left, right = right, left ^ self.mix(right, key)
+        return (left << self.half_bits) | right
+
+    def __getitem__(self, position):
+        '''
+        RETURNS the index at the given position of the permutation
+        INPUT
+            position; integer from 0 to size - 1
+        '''
+        # Walk the cycle until it comes back into range. The block holds fewer than 4 * size values, so this is short.
+        value = self.encrypt(position)
+        while value >= self.size:
+            value = self.encrypt(value)
+        return value
+
+class KeywordDeck:
+    '''
+    A guild's shuffled deck of keywords. The deck order is determined by a seed, so only the seed and position are stored.
+    '''
+
+    guild_id = None # Integer Discord guild id this deck belongs to
+    keywords = None # Sequence of string keywords the deck is shuffled from
+    seed = None     # Integer seed of the current shuffle
+    position = None # Integer number of keywords drawn from the current shuffle
+    order = None    # Permutation of keyword indices in the current shuffle
+
+    def __init__(self, guild_id, seed=None, position=0, keywords=None):
+        '''
+        Initializes this deck
+        INPUT
+            guild_id; integer Discord guild id
+            seed; integer seed of the shuffle to resume, or None for a new shuffle
+            position; integer number of keywords already drawn from that shuffle
+            keywords; sequence of string keywords, such as a CorpusView, or None for pictionary_words.txt
+        '''
+        self.guild_id = guild_id
+        self.keywords = keywords if keywords is not None else get_corpus()
+        self.shuffle(seed)
+        self.position = position
+
+    def shuffle(self, seed=None):
+        '''
+        Starts a new shuffle of all the keywords
+        INPUT
+            seed; integer seed of the shuffle, or None for a random seed
+        '''
+        self.seed = random.getrandbits(32) if seed is None else seed
+        self.order = Permutation(len(self.keywords), self.seed)
+        self.position = 0
+
+    def draw(self):
+        '''
+        RETURNS the next string keyword, reshuffling once the deck is exhausted
+        '''
+        if self.position >= len(self.order):
+            self.shuffle()
+        keyword = self.keywords[self.order[self.position]]
+        self.position += 1
+        return keyword
+
+def create_table(conn):
+    '''
+    Creates the keyword_decks table if needed
+    INPUT
+        conn; sqlite3 connection
+    '''
+    conn.execute("CREATE TABLE IF NOT EXISTS keyword_decks ("
+                 "guild_id INTEGER PRIMARY KEY, "
+                 "seed INTEGER NOT NULL, "
+                 "position INTEGER NOT NULL, "
+                 "size INTEGER NOT NULL)")
+
+def load_deck(guild_id, keywords=None):
+    '''
+    RETURNS the stored KeywordDeck for the given guild, or a new deck if none is stored or the keywords changed size
+    INPUT
+        guild_id; integer Discord guild id
+        keywords; sequence of string keywords, or None for pictionary_words.txt
+    '''
+    keywords = keywords if keywords is not None else get_corpus()
+    with storage.connect() as conn:
+        create_table(conn)
+        row = conn.execute("SELECT seed, position, size FROM keyword_decks WHERE guild_id = ?",
+                           (guild_id,)).fetchone()
+    if row is None or row[2] != len(keywords):
+        return KeywordDeck(guild_id, keywords=keywords)
+    return KeywordDeck(guild_id, row[0], row[1], keywords)
+
+def save_deck(deck):
+    '''
+    Stores the given deck's seed and position
+    INPUT
+        deck; KeywordDeck to store
+    '''
+    with storage.connect() as conn:
+        create_table(conn)
+        conn.execute("INSERT OR REPLACE INTO keyword_decks VALUES (?, ?, ?, ?)",
+                     (deck.guild_id, deck.seed, deck.position, len(deck.order)))
+
+def get_large_corpus():
+    '''
+    RETURNS the Corpus at CORPUS_PATH, or None if no corpus is configured
+    '''
+    global _large_corpus
+    if _large_corpus is None and CORPUS_PATH:
+        _large_corpus = Corpus(CORPUS_PATH)
+    return _large_corpus
+
+def get_keywords(category=None, difficulty=None):
+    '''
+    RETURNS sequence of the string keywords decks are shuffled from: the configured corpus's keywords matching the filter,
+    or pictionary_words.txt if no corpus is configured or no keyword matches
+    INPUT
+        category; string category to match in the configured corpus, or None for any
+        difficulty; integer difficulty to match in the configured corpus, or None for any
+    '''
+    large_corpus = get_large_corpus()
+    if large_corpus is None:
+        return get_corpus()
+    key = (category, difficulty)
+    if key not in _views:
+        _views[key] = CorpusView(large_corpus, category, difficulty)
+    return _views[key] if len(_views[key]) else get_corpus()
+
+async def draw_keyword(guild_id, category=CORPUS_CATEGORY, difficulty=CORPUS_DIFFICULTY):
+    '''
+    RETURNS the next string keyword from the given guild's deck
+    INPUT
+        guild_id; integer Discord guild id
+        category; string category to draw from the configured corpus, or None for any
+        difficulty; integer difficulty to draw from the configured corpus, or None for any
+    '''
+    keywords = get_keywords(category, difficulty)
+    deck = _decks.get(guild_id)
+    if deck is None or deck.keywords is not keywords:
+        deck = await asyncio.to_thread(load_deck, guild_id, keywords) if PERSIST_DECKS else KeywordDeck(guild_id, keywords=keywords)
+        # Another draw may have loaded the deck while this one waited
+        current = _decks.get(guild_id)
+        if current is not None and current.keywords is keywords:
+            deck = current
+        else:
+            _decks[guild_id] = deck
+    keyword = deck.draw()
+    if PERSIST_DECKS:
+        await asyncio.to_thread(save_deck, deck)
+    return keyword
@@ -4,12 +4,21 @@ Main script for Witness: Social Deducation Word Game
 Runs the Discord bot client and handles user messages and reactions.
 """
 
+import asyncio
 import discord
 import os
 from dotenv import load_dotenv
+
+# Take environment variables from .env before the game modules read their settings on import
+load_dotenv()
+
 from gameplay import Game
+from game_registry import GameManager
+import event_log
+import prune
+import snapshots
+import usage
 
-MAX_GAMES = 3
 MAX_PLAYERS = 12
 
 # Discord client settings
@@ -18,8 +27,9 @@ intents.message_content = True
 intents.reactions = True
 client = discord.Client(intents=intents)
 
-# List of ongoing Witness games
-game_list = []
+# Ongoing Witness games
+games = GameManager()
+reaping = False
 
 @client.event
 async def on_ready():
@@ -28,11 +38,26 @@ async def on_ready():
     '''
     print('DISCORD BOT logged in as {0.user}.'.format(client))
 
+    # Periodically remove ended and abandoned games. on_ready may run again after reconnecting.
+    global reaping
+    if not reaping:
+        games.start_reaping()
+        reaping = True
+
+        # Restore games interrupted by a restart, then finish interrupted cleanups
+        await snapshots.restore_games(client, games)
+        await prune.resume_pending(client, games)
+
 @client.event
 async def on_message(message):
     '''
     Actions in response to a user message.
     '''
+    # Find the game associated with the message. Ignore non-command messages outside of game categories.
+    game = games.for_channel(message.channel)
+    if game is None and not message.content.startswith("$"):
+        return
+
     # Ignore messages sent by self
     if message.author.id == client.user.id:
         return
@@ -44,26 +69,33 @@ async def on_message(message):
 
     # Start new Witness game on $play
     if message.content == "$play":
-        if len(game_list) < MAX_GAMES:
-            game_list.append(await Game.initialize(message))
+        refusal = games.check_quota(message.guild.id)
+        if refusal is None:
+            games.add(await Game.initialize(message, games))
         else:
-            await message.channel.send(f"Cannot create a new game. There are already ongoing {MAX_GAMES} games.")
+            await message.channel.send(refusal)
+        return
+
+    # Report game counts on $stats
+    if message.content == "$stats":
+        metrics = games.metrics()
+        await message.channel.send("\n".join([f"{name} \t {value}"
+                                              for name, value in metrics.items()]))
         return
     
-    # Clean up existing Witness categories and channels on $prune
+    # Clean up leftover Witness categories and channels in the background on $prune
     if message.content == "$prune":
-        for category in message.guild.categories:
-            if category.name.startswith("Witness-"):
-                for channel in category.channels:
-                    await channel.delete()  
-                await category.delete()
+        job = prune.start_prune(message.guild, games, message.channel)
+        if job.channel is not message.channel:
+            await message.channel.send(f"Cleanup is already running: {job.deleted} of {job.total} deleted.")
         return
 
-    # Find the game associated with the message and let the Game handle the message
-    for game in game_list:
-        if message.channel.category.id == game.category.id:
-            await game.handle_message(message)
-            return
+    # Let the Game handle the message
+    if game is not None:
+        await game.handle_message(message)
+        if game.ended:
+            games.remove(game)
+        return
 
 @client.event
 async def on_reaction_add(reaction, user):
@@ -71,19 +103,34 @@ async def on_reaction_add(reaction, user):
     Actions in response to a message reaction
     '''
     # Ignore reactions made by self
-    if user == client.user.id:
+    if user.id == client.user.id:
         return
 
     # If a user reacts to a game registration message, then add the user as a player in that game
-    for game in game_list:
-        if reaction.message.id == game.registration_msg.id:
-            if user not in [player.user for player in game.player_list]:
-                if len(game.player_list) < MAX_PLAYERS:
-                    await game.add_player(user)
-                    return
-            
-# Take environment variables from .env   
-load_dotenv()
+    game = games.for_registration(reaction.message.id)
+    if game is not None and game.get_player(user.id) is None:
+        if len(game.player_list) < MAX_PLAYERS:
+            await game.add_player(user)
+            return
+
+async def run(token):
+    '''
+    Runs the Discord client until it is closed or interrupted, then writes the buffered events, snapshots and OpenAI usage
+    INPUT
+        token; string Discord bot token
+    '''
+    try:
+        async with client:
+            await client.start(token)
+    finally:
+        await event_log.EVENT_LOG.flush()
+        await snapshots.flush()
+        await usage.flush()
 
-# Run discord client
-client.run(os.getenv('DISCORD_TOKEN'))
\ No newline at end of file
+if __name__ == "__main__":
+    # Run discord client
+    discord.utils.setup_logging()
+    try:
+        asyncio.run(run(os.getenv('DISCORD_TOKEN')))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,232 @@
+"""
+Helpers for delivering Discord messages to many players at once.
+"""
+
+import asyncio
+import os
+import discord
+
+# Maximum number of Discord sends in flight for one fan-out
+MAX_PARALLEL_SENDS = 8
+
+# Discord's maximum message length
+MAX_MESSAGE_LENGTH = 2000
+
+# Seconds an Outbox waits for more messages before sending
+OUTBOX_LINGER = float(os.getenv("OUTBOX_LINGER", 0.05))
+
+# Seconds an Outbox waits before retrying a failed send, and the number of failed sends in a row before it gives up
+OUTBOX_RETRY_DELAY = float(os.getenv("OUTBOX_RETRY_DELAY", 5))
+OUTBOX_RETRIES = int(os.getenv("OUTBOX_RETRIES", 3))
+
+# Maximum number of messages an Outbox holds. The oldest are dropped first.
+OUTBOX_MAX_PENDING = int(os.getenv("OUTBOX_MAX_PENDING", 100))
+
+# Send errors that retrying cannot fix: the channel is gone, or the bot may no longer send to it
+PERMANENT_ERRORS = (discord.NotFound, discord.Forbidden)
+
+async def run_for_each(players, action, max_parallel=MAX_PARALLEL_SENDS):
+    '''
+    Runs an action for each of the given players concurrently.
+    A failed action is reported to the terminal and does not stop the actions for the other players.
+    INPUT
+        players; list of Player objects
+        action; function mapping a Player object to a coroutine to await
+        max_parallel; maximum number of actions in flight at once
+    RETURNS
+        list of the Player objects whose action failed
+    '''
+    slots = asyncio.Semaphore(max_parallel)
+
+    async def run(ply):
+        async with slots:
+            await action(ply)
+
+    results = await asyncio.gather(*[run(ply) for ply in players], return_exceptions=True)
+    failed = []
+    for ply, result in zip(players, results):
+        if isinstance(result, Exception):
+            print(f"Failed for player {ply.user.name}: {result!r}")
+            failed.append(ply)
+    return failed
+
+async def fan_out(players, content, max_parallel=MAX_PARALLEL_SENDS, flush=False):
+    '''
+    Sends a message to each of the given players concurrently.
+    A failed send is reported to the terminal and does not stop delivery to the other players.
+    INPUT
+        players; list of Player objects to message
+        content; string message, or function mapping a Player object to that player's string message
+        max_parallel; maximum number of sends in flight at once
+        flush; boolean whether to wait until each player's message is delivered
+    RETURNS
+        list of the Player objects whose send failed
+    '''
+    if flush:
+        return await run_for_each(players,
+                                  lambda ply: ply.send_message(content(ply) if callable(content) else content, flush=True),
+                                  max_parallel)
+
+    # Without flush, sending only queues the message in each player's outbox, so no tasks are needed
+    failed = []
+    for ply in players:
+        try:
+            await ply.send_message(content(ply) if callable(content) else content)
+        except Exception as e:
+            print(f"Failed for player {ply.user.name}: {e!r}")
+            failed.append(ply)
+    return failed
+
+def pack_messages(messages, limit=MAX_MESSAGE_LENGTH):
+    '''
+    Merges consecutive messages into as few messages as possible, each at most limit characters
+    INPUT
+        messages; list of string messages, in order
+        limit; maximum characters per merged message
+    RETURNS
+        list of string merged messages, in order
+    '''
+    packed = []
+    current = ""
+    for msg in messages:
+        # Split a message that is too long on its own, preferring line breaks
+        while len(msg) > limit:
+            cut = msg.rfind("\n", 0, limit)
+            if cut <= 0:
+                cut = limit
+            pieces = [msg[:cut], msg[cut:].lstrip("\n")]
+            if current:
+                packed.append(current)
+                current = ""
+            packed.append(pieces[0])
+            msg = pieces[1]
+        if not msg:
+            continue
+        if current and len(current) + 1 + len(msg) <= limit:
+            current += "\n" + msg
+        else:
+            if current:
+                packed.append(current)
+            current = msg
+    if current:
+        packed.append(current)
+    return packed
+
+class Outbox:
+    '''
+    Queues messages for one Discord channel and sends them in order, merging messages queued close together.
+    A failed send is reported to the terminal and raised by the next flush(). The unsent messages are retried
+    after OUTBOX_RETRY_DELAY seconds, and dropped after OUTBOX_RETRIES failures in a row or a PERMANENT_ERRORS error.
+    '''
+
+    channel = None  # Discord channel the messages are sent to
+    linger = None   # Seconds to wait for more messages before sending
+    pending = None  # List of string messages not yet sent
+    task = None     # asyncio.Task sending the pending messages, or None when idle
+    wake = None     # asyncio.Event that cuts the linger short for flush()
+    error = None    # Exception of the most recent failed send not yet raised by flush(), or None
+    failures = None # Number of failed sends in a row
+
+    def __init__(self, channel, linger=None):
+        '''
+        Initializes this Outbox
+        INPUT
+            channel; Discord channel to send messages to
+            linger; seconds to wait for more messages before sending. Defaults to OUTBOX_LINGER.
+        '''
+        self.channel = channel
+        self.linger = OUTBOX_LINGER if linger is None else linger
+        self.pending = []
+        self.task = None
+        self.wake = asyncio.Event()
+        self.error = None
+        self.failures = 0
+
+    def queue(self, content):
+        '''
+        Queues the given message to be sent shortly
+        INPUT
+            content; string message
+        '''
+        self.pending.append(str(content))
+        if len(self.pending) > OUTBOX_MAX_PENDING:
+            print(f"Outbox for {self.channel} is full. Dropping its oldest message.")
+            del self.pending[0]
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def flush(self):
+        '''
+        Sends all queued messages now and waits until they are delivered
+        Raises the error of a failed send since the last flush. The unsent messages stay queued.
+        '''
+        if self.task is None and self.pending:
+            self.task = asyncio.create_task(self.run())
+        if self.task is not None:
+            self.wake.set()
+            await asyncio.shield(self.task)
+        if self.error is not None:
+            error = self.error
+            self.error = None
+            raise error
+
+    def close(self):
+        '''
+        Drops the queued messages and stops sending
+        '''
+        self.pending = []
+        self.error = None
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def handle_failure(self, error):
+        '''
+        Reports a failed send and decides whether to retry the queued messages
+        INPUT
+            error; Exception raised by the send
+        RETURNS
+            boolean whether to retry; if not, the queued messages are dropped
+        '''
+        self.error = error
+        self.failures += 1
+        if isinstance(error, PERMANENT_ERRORS) or self.failures > OUTBOX_RETRIES:
+            print(f"Failed to send to {self.channel}: {error!r}. Dropping {len(self.pending)} queued messages.")
+            self.pending = []
+            self.failures = 0
+            return False
+        print(f"Failed to send to {self.channel}: {error!r}. Retrying {len(self.pending)} queued messages in {OUTBOX_RETRY_DELAY}sec.")
+        return True
+
+    async def run(self, delay=None):
+        '''
+        Waits delay seconds, or until flush(), then sends the queued messages until none are left or a send fails
+        INPUT
+            delay; seconds to wait before sending. Defaults to the linger period.
+        '''
+        delay = self.linger if delay is None else delay
+        retry = False
+        try:
+            if delay <= 0:
+                await asyncio.sleep(0)  # Still merge the messages queued in the same event loop iteration
+            elif not self.wake.is_set():
+                try:
+                    await asyncio.wait_for(self.wake.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+            while self.pending:
+                packed = pack_messages(self.pending)
+                self.pending = []
+                for i, msg in enumerate(packed):
+                    try:
+                        await self.channel.send(msg)
+                        self.failures = 0
+                    except Exception as e:
+                        # Keep the failed message and everything after it for the next attempt
+                        self.pending = packed[i:] + self.pending
+                        retry = self.handle_failure(e)
+                        return
+        finally:
+            self.wake.clear()
+            if self.task is asyncio.current_task():
+                self.task = asyncio.create_task(self.run(OUTBOX_RETRY_DELAY)) if retry else None
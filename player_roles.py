@@ -2,62 +2,43 @@
 Classes for player roles: Sheriff, Civilians, Mastermind, Villains
 """
 
-import pandas as pd
+import csv
 import re
 import random
+from collections import namedtuple
 import gamestates as gs
 
-# Get the .csv file describing each role's abilities
-ROLE_DF = pd.read_csv("Role Summary.csv",
-                      index_col="Title")
+# Registry entry for one role, compiled from Role Summary.csv
+RoleInfo = namedtuple("RoleInfo", ["title", "role_class", "intro", "team", "assignable"])
+
+ROLE_REGISTRY = {}      # Dictionary mapping each lowercase role title to its RoleInfo, built at the end of this module
+ROLE_DESC = None        # String table of all the roles and their descriptions, built at the end of this module
 
 def get_titles():
     '''
     RETURNS list of all unique role titles that can be assigned at the start of the game
     '''
-    return [title.lower() for title in ROLE_DF.index.tolist()]
+    return [key for key, info in ROLE_REGISTRY.items() if info.assignable]
 
 def get_role_desc():
     '''
     RETURNS string table of all the unique roles and their descriptions
     '''
-    return "\n".join([f"**{title}**\t{ROLE_DF.loc[title, 'Intro']}"
-                      for title in ROLE_DF.index])
+    return ROLE_DESC
 
-async def role_builder(ply, title="civilian"):
+def role_builder(ply, title="civilian"):
     '''
-    RETURNS an instance of the Role associated with the given title
+    RETURNS an instance of the Role associated with the given title. Sends no messages; see Role.send_introduction.
     INPPUT
         ply; the player for which the Role should be instantiated
         title; the title of the role
     RETURNS
         instance of the Role
     '''
-    match title.lower():
-        case "civilian":
-            return await RoleCivilian.initialize(ply)
-        case "villain":
-            return await RoleVillain.initialize(ply)
-        case "reporter":
-            return await RoleReporter.initialize(ply)
-        case "undercover":
-            return await RoleUndercover.initialize(ply)
-        case "stenographer":
-            return await RoleStenographer.initialize(ply)
-        case "detective":
-            return await RoleDetective.initialize(ply)
-        case "forensic":
-            return await RoleForensic.initialize(ply)
-        case "censorer":
-            return await RoleCensorer.initialize(ply)
-        case "intimidator":
-            return await RoleIntimidator.initialize(ply)
-        case "hacker":
-            return await RoleHacker.initialize(ply)
-        case "politician":
-            return await RolePolitician.initialize(ply)
-        case _:
-            raise Exception(f"Invalid title {title}.")
+    info = ROLE_REGISTRY.get(title.lower())
+    if info is None or not info.assignable:
+        raise Exception(f"Invalid title {title}.")
+    return info.role_class.initialize(ply)
 
 class Role:
     '''
@@ -70,15 +51,15 @@ class Role:
     power_activated = None  # Counts the number of times this role has activated their special power
 
 
-    async def initialize(player):
+    def initialize(player):
         '''
         RETURNS this intialized Role object
         INPUT
             player; Player object who holds this role
         '''
-        return await Role.initialize_helper(player, "Unassigned", Role())
+        return Role.initialize_helper(player, "Unassigned", Role())
 
-    async def initialize_helper(player, title, role_instance):
+    def initialize_helper(player, title, role_instance):
         '''
         Intializes and returns the given Role object
         INPUT
@@ -92,15 +73,27 @@ class Role:
         self.player = player
         self.title = title
         self.power_activated = 0
-        # await self.send_team_introduction_message()
-        await self.send_role_introduction_message()
         return self
 
+    def get_team(self):
+        '''
+        RETURNS string team of this role from ROLE_REGISTRY, "Villain" or "Civilian", or None for an unassigned role
+        '''
+        info = ROLE_REGISTRY.get(self.title.lower())
+        return info.team if info is not None else None
+
+    async def send_introduction(self):
+        '''
+        Sends the player the introduction messages for their role and team.
+        '''
+        await self.send_role_introduction_message()
+        await self.send_team_introduction_message()
+
     async def send_role_introduction_message(self):
         '''
         Sends the player an introduction message for their role.
         '''
-        await self.player.send_message(f"**{self.title}**: {ROLE_DF.loc[self.title, 'Intro']}")
+        await self.player.send_message(f"**{self.title}**: {ROLE_REGISTRY[self.title.lower()].intro}")
 
     async def send_team_introduction_message(self):
         '''
@@ -150,13 +143,13 @@ class RoleCivilian(Role):
     Class for Civilian role. Parent class for Civilians with special powers, like the Sheriff.
     '''
 
-    async def initialize(player):
+    def initialize(player):
         '''
         RETURNS this intialized Role object
         INPUT
             player; Player object who holds this role
         '''
-        return await Role.initialize_helper(player, "Civilian", RoleCivilian())
+        return Role.initialize_helper(player, "Civilian", RoleCivilian())
     
     async def send_team_introduction_message(self):
         '''
@@ -169,13 +162,13 @@ class RoleVillain(Role):
     Class for Villain role. Parent class for Villains with special powers, like the Mastermind.
     '''
 
-    async def initialize(player):
+    def initialize(player):
         '''
         RETURNS this intialized Role object
         INPUT
             player; Player object who holds this role
         '''
-        return await Role.initialize_helper(player, "Villain", RoleVillain())
+        return Role.initialize_helper(player, "Villain", RoleVillain())
     
     async def send_team_introduction_message(self):
         '''
@@ -189,7 +182,7 @@ class RoleVillain(Role):
         # Report the villainous teammates
         msg = "Here's your villainous team:"
         for ply in self.player.game.player_list:
-            if isinstance(ply.role, RoleVillain):
+            if ply.role.get_team() == "Villain":
                 msg += f"\n\t**{ply.user.name}**"
         await self.player.send_message(msg)
 
@@ -198,13 +191,13 @@ class RoleReporter(RoleCivilian):
     Reporter gets alerted whenever a power is activated.
     '''
     
-    async def initialize(player):
+    def initialize(player):
         '''
         RETURNS this intialized Role object
         INPUT
             player; Player object who holds this role
         '''
-        self = await Role.initialize_helper(player, "Reporter", RoleReporter())
+        self = Role.initialize_helper(player, "Reporter", RoleReporter())
         return self
     
 class RoleUndercover(RoleCivilian):
@@ -212,13 +205,13 @@ class RoleUndercover(RoleCivilian):
     Undercover can alert the questioner that they are a civilian.
     '''
     
-    async def initialize(player):
+    def initialize(player):
         '''
         RETURNS this intialized Role object
         INPUT
             player; Player object who holds this role
         '''
-        self = await Role.initialize_helper(player, "Undercover", RoleUndercover())
+        self = Role.initialize_helper(player, "Undercover", RoleUndercover())
         return self
     
     async def power(self, value=None):
@@ -240,13 +233,13 @@ class RoleStenographer(RoleCivilian):
     Stenographer can see the full text of one question.
     '''
     
-    async def initialize(player):
+    def initialize(player):
         '''
         RETURNS this intialized Role object
         INPUT
             player; Player object who holds this role
         '''
-        self = await Role.initialize_helper(player, "Stenographer", RoleStenographer())
+        self = Role.initialize_helper(player, "Stenographer", RoleStenographer())
         return self
     
     async def power(self, value=None):
@@ -266,13 +259,13 @@ class RoleDetective(RoleCivilian):
     Detective sees one of the banned words
     '''
     
-    async def initialize(player):
+    def initialize(player):
         '''
         RETURNS this intialized Role object
         INPUT
             player; Player object who holds this role
         '''
-        self = await Role.initialize_helper(player, "Detective", RoleDetective())
+        self = Role.initialize_helper(player, "Detective", RoleDetective())
         return self
     
     async def send_role_introduction_message(self):
@@ -289,13 +282,13 @@ class RoleForensic(RoleCivilian):
     Forensic sees a banned word, but its vowels are missing and its letters are scrambled.
     '''
     
-    async def initialize(player):
+    def initialize(player):
         '''
         RETURNS this intialized Role object
         INPUT
             player; Player object who holds this role
         '''
-        self = await Role.initialize_helper(player, "Forensic", RoleForensic())
+        self = Role.initialize_helper(player, "Forensic", RoleForensic())
         return self
     
     async def send_role_introduction_message(self):
@@ -318,13 +311,13 @@ class RoleCensorer(RoleVillain):
     Censorer can supress the WITNESS response.
     '''
     
-    async def initialize(player):
+    def initialize(player):
         '''
         RETURNS this intialized Role object
         INPUT
             player; Player object who holds this role
         '''
-        self = await Role.initialize_helper(player, "Censorer", RoleCensorer())
+        self = Role.initialize_helper(player, "Censorer", RoleCensorer())
         return self
     
     async def power(self, value=None):
@@ -345,13 +338,13 @@ class RoleIntimidator(RoleVillain):
     Intimidator can change the text of one WITNESS question
     '''
     
-    async def initialize(player):
+    def initialize(player):
         '''
         RETURNS this intialized Role object
         INPUT
             player; Player object who holds this role
         '''
-        self = await Role.initialize_helper(player, "Intimidator", RoleIntimidator())
+        self = Role.initialize_helper(player, "Intimidator", RoleIntimidator())
         return self
     
     async def power(self, value=""):
@@ -373,13 +366,13 @@ class RoleHacker(RoleVillain):
     Hacker can burn one of the WITNESS's questions, making them instead answer the previous question again
     '''
     
-    async def initialize(player):
+    def initialize(player):
         '''
         RETURNS this intialized Role object
         INPUT
             player; Player object who holds this role
         '''
-        self = await Role.initialize_helper(player, "Hacker", RoleHacker())
+        self = Role.initialize_helper(player, "Hacker", RoleHacker())
         return self
     
     async def power(self, value=None):
@@ -403,13 +396,13 @@ class RolePolitician(RoleCivilian):
     Politician can change to a Crook.
     '''
     
-    async def initialize(player):
+    def initialize(player):
         '''
         RETURNS this intialized Role object
         INPUT
             player; Player object who holds this role
         '''
-        self = await Role.initialize_helper(player, "Politician", RolePolitician())
+        self = Role.initialize_helper(player, "Politician", RolePolitician())
         return self
     
     async def power(self, value=None):
@@ -422,7 +415,8 @@ class RolePolitician(RoleCivilian):
             if isinstance(self.player.game.gamestate, gs.GameStateQuestion):
                 self.power_activated += 1
                 await self.player.game.send_global_message("The Politician has been corrupted! They are now a Crook on the Villain team.")
-                self.player.role = await RoleCrook.initialize(self.player)
+                self.player.role = RoleCrook.initialize(self.player)
+                await self.player.role.send_role_introduction_message()
                 return
             else:
                 await self.player.send_message("You can only activate your Politician power during the Questioning phase.")
@@ -433,10 +427,44 @@ class RoleCrook(RoleVillain):
     This role is not intended to be assigned. It is what the Politician turns into if they activate their power.
     '''
 
-    async def initialize(player):
+    def initialize(player):
         self = RoleCrook()
         self.player = player
         self.title = "Crook"
         self.power_activated = 1
-        await self.send_role_introduction_message()
-        return self
\ No newline at end of file
+        return self
+
+def build_role_registry(path="Role Summary.csv"):
+    '''
+    Builds ROLE_REGISTRY and ROLE_DESC from the .csv file describing each role's abilities
+    INPUT
+        path; path of the .csv file with Title and Intro columns
+    '''
+    global ROLE_DESC
+    role_classes = {"civilian": RoleCivilian,
+                    "villain": RoleVillain,
+                    "reporter": RoleReporter,
+                    "undercover": RoleUndercover,
+                    "stenographer": RoleStenographer,
+                    "detective": RoleDetective,
+                    "forensic": RoleForensic,
+                    "censorer": RoleCensorer,
+                    "intimidator": RoleIntimidator,
+                    "hacker": RoleHacker,
+                    "politician": RolePolitician,
+                    "crook": RoleCrook}
+
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        rows = list(csv.DictReader(f))
+    ROLE_REGISTRY.clear()
+    for row in rows:
+        role_class = role_classes[row["Title"].lower()]
+        ROLE_REGISTRY[row["Title"].lower()] = RoleInfo(title=row["Title"],
+                                                       role_class=role_class,
+                                                       intro=row["Intro"],
+                                                       team="Villain" if issubclass(role_class, RoleVillain) else "Civilian",
+                                                       assignable=role_class is not RoleCrook)
+    ROLE_DESC = "\n".join([f"**{info.title}**\t{info.intro}"
+                           for info in ROLE_REGISTRY.values()])
+
+build_role_registry()
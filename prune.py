@@ -0,0 +1,239 @@
+"""
+Background cleanup of leftover Witness categories and channels, run by $prune.
+Deletions run concurrently under a request rate limit, report progress, never touch live games,
+and resume after a restart.
+"""
+
+import asyncio
+import os
+from time import monotonic
+import storage
+
+# Maximum number of Discord delete requests per second, and in flight at once
+PRUNE_RATE = float(os.getenv("PRUNE_RATE", 5))
+PRUNE_CONCURRENCY = int(os.getenv("PRUNE_CONCURRENCY", 4))
+
+# Seconds between progress reports
+PROGRESS_INTERVAL = 5
+
+_jobs = {}  # Dictionary mapping each guild id to its running PruneJob
+
+class RateLimiter:
+    '''
+    Token bucket that lets at most rate requests per second through, with bursts up to burst requests.
+    '''
+
+    rate = None     # Tokens added per second
+    burst = None    # Maximum number of stored tokens
+    tokens = None   # Number of stored tokens
+    updated = None  # monotonic() time tokens was last updated
+    lock = None     # asyncio.Lock that serializes waiting callers
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1, rate)
+        self.tokens = self.burst
+        self.updated = monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        '''
+        Waits until a request may be sent
+        '''
+        async with self.lock:
+            now = monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self.tokens = 1
+                self.updated = monotonic()
+            self.tokens -= 1
+
+def create_table(conn):
+    '''
+    Creates the prune_pending table if needed
+    INPUT
+        conn; sqlite3 connection
+    '''
+    conn.execute("CREATE TABLE IF NOT EXISTS prune_pending ("
+                 "guild_id INTEGER NOT NULL, "
+                 "category_id INTEGER NOT NULL, "
+                 "PRIMARY KEY (guild_id, category_id))")
+
+def save_pending(guild_id, category_ids):
+    '''
+    Records the categories a prune job still has to delete, replacing the guild's previous record
+    INPUT
+        guild_id; integer Discord guild id
+        category_ids; list of integer Discord category ids
+    '''
+    with storage.connect() as conn:
+        create_table(conn)
+        conn.execute("DELETE FROM prune_pending WHERE guild_id = ?", (guild_id,))
+        conn.executemany("INSERT OR IGNORE INTO prune_pending VALUES (?, ?)",
+                         [(guild_id, category_id) for category_id in category_ids])
+
+def remove_pending(guild_id, category_id):
+    '''
+    Records that a category was deleted
+    INPUT
+        guild_id; integer Discord guild id
+        category_id; integer Discord category id
+    '''
+    with storage.connect() as conn:
+        create_table(conn)
+        conn.execute("DELETE FROM prune_pending WHERE guild_id = ? AND category_id = ?",
+                     (guild_id, category_id))
+
+def load_pending():
+    '''
+    RETURNS dictionary mapping the integer id of each guild with an unfinished prune job to the set of its category ids still to delete
+    '''
+    pending = {}
+    with storage.connect() as conn:
+        create_table(conn)
+        for guild_id, category_id in conn.execute("SELECT guild_id, category_id FROM prune_pending"):
+            pending.setdefault(guild_id, set()).add(category_id)
+    return pending
+
+class PruneJob:
+    '''
+    Deletes a guild's Witness categories, and their channels, that do not belong to a live game.
+    '''
+
+    guild = None        # Discord guild to clean up
+    games = None        # GameRegistry of live games, whose categories are never deleted
+    channel = None      # Discord channel to report progress in, or None
+    category_ids = None # Set of integer ids of the categories to delete, or None to find them by name
+    limiter = None      # RateLimiter for delete requests
+    slots = None        # asyncio.Semaphore limiting delete requests in flight
+    total = None        # Number of categories and channels to delete
+    deleted = None      # Number of categories and channels deleted so far
+    failed = None       # Number of deletions that failed
+    task = None         # asyncio.Task running this job
+
+    def __init__(self, guild, games, channel=None, category_ids=None):
+        '''
+        Initializes this job
+        INPUT
+            guild; Discord guild to clean up
+            games; GameRegistry of live games
+            channel; Discord channel to report progress in, or None
+            category_ids; set of integer ids of the categories to delete, e.g. those an interrupted job had left,
+                or None to delete every Witness category
+        '''
+        self.guild = guild
+        self.games = games
+        self.channel = channel
+        self.category_ids = category_ids
+        self.limiter = RateLimiter(PRUNE_RATE)
+        self.slots = asyncio.Semaphore(PRUNE_CONCURRENCY)
+        self.total = 0
+        self.deleted = 0
+        self.failed = 0
+
+    def get_targets(self):
+        '''
+        RETURNS list of the guild's Witness categories that do not host a live game.
+        If the job was given category_ids, only those categories that still exist.
+        '''
+        if self.category_ids is not None:
+            categories = [category for category in self.guild.categories if category.id in self.category_ids]
+        else:
+            categories = [category for category in self.guild.categories if category.name.startswith("Witness-")]
+        return [category for category in categories if not self.games.owns_category(category.id)]
+
+    async def delete(self, target):
+        '''
+        Deletes a category or channel under the rate limit
+        INPUT
+            target; Discord category or channel
+        '''
+        async with self.slots:
+            await self.limiter.acquire()
+            try:
+                await target.delete()
+                self.deleted += 1
+            except Exception as e:
+                print(f"Failed to delete {target}: {e!r}")
+                self.failed += 1
+
+    async def delete_category(self, category):
+        '''
+        Deletes the category's channels concurrently, then the category itself, unless a live game took it over
+        INPUT
+            category; Discord category
+        '''
+        if not self.games.owns_category(category.id):
+            await asyncio.gather(*[self.delete(channel) for channel in list(category.channels)])
+            await self.delete(category)
+        await asyncio.to_thread(remove_pending, self.guild.id, category.id)
+
+    async def report(self, content):
+        '''
+        Sends a progress report to the job's channel, if any
+        INPUT
+            content; string report
+        '''
+        if self.channel is not None:
+            try:
+                await self.channel.send(content)
+            except Exception as e:
+                print(f"Failed to report prune progress: {e!r}")
+
+    async def run(self):
+        '''
+        Deletes every target category and its channels, reporting progress along the way
+        '''
+        targets = self.get_targets()
+        self.total = len(targets) + sum(len(category.channels) for category in targets)
+        await asyncio.to_thread(save_pending, self.guild.id, [category.id for category in targets])
+        if not targets:
+            await self.report("There are no Witness categories to clean up.")
+            return
+        await self.report(f"Cleaning up {len(targets)} Witness categories ({self.total} categories and channels) in the background.")
+
+        # Report progress periodically while categories are deleted
+        work = asyncio.gather(*[self.delete_category(category) for category in targets])
+        while not work.done():
+            await asyncio.wait([work], timeout=PROGRESS_INTERVAL)
+            if not work.done():
+                await self.report(f"Cleanup progress: {self.deleted} of {self.total} deleted.")
+        await work
+        await self.report(f"Cleanup finished: {self.deleted} of {self.total} deleted, {self.failed} failed.")
+
+    def start(self):
+        '''
+        Runs this job in a background task, registered as the guild's running job
+        '''
+        _jobs[self.guild.id] = self
+        self.task = asyncio.create_task(self.run())
+        self.task.add_done_callback(lambda task: _jobs.pop(self.guild.id, None))
+        return self
+
+def start_prune(guild, games, channel=None, category_ids=None):
+    '''
+    RETURNS the guild's PruneJob, starting a new one unless one is already running
+    INPUT
+        guild; Discord guild to clean up
+        games; GameRegistry of live games
+        channel; Discord channel to report progress in, or None
+        category_ids; set of integer ids of the categories to delete, or None to delete every Witness category
+    '''
+    job = _jobs.get(guild.id)
+    if job is None:
+        job = PruneJob(guild, games, channel, category_ids).start()
+    return job
+
+async def resume_pending(client, games):
+    '''
+    Restarts the prune jobs that were interrupted by a restart, on the categories they had left to delete
+    INPUT
+        client; logged-in Discord client
+        games; GameRegistry of live games
+    '''
+    for guild_id, category_ids in (await asyncio.to_thread(load_pending)).items():
+        guild = client.get_guild(guild_id)
+        if guild is not None:
+            start_prune(guild, games, category_ids=category_ids)
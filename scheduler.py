@@ -0,0 +1,129 @@
+"""
+DeadlineScheduler runs timed callbacks, such as phase time limits, for every game from one task.
+"""
+
+import asyncio
+import heapq
+import itertools
+from time import monotonic
+
+class TimerHandle:
+    '''
+    Handle for a scheduled callback. Cancelling it stops the callback from running.
+    '''
+
+    deadline = None     # monotonic() time at which the callback runs
+    callback = None     # Coroutine function or function to call
+    args = None         # Tuple of arguments for the callback
+    cancelled = None    # Boolean whether this timer was cancelled
+
+    def __init__(self, deadline, callback, args):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        '''
+        Stops the callback from running
+        '''
+        self.cancelled = True
+
+class DeadlineScheduler:
+    '''
+    Keeps one heap of deadlines and a single task that sleeps until the earliest one.
+    '''
+
+    heap = None     # Heap of (deadline, sequence number, TimerHandle)
+    counter = None  # Iterator of sequence numbers that keep equal deadlines in scheduling order
+    task = None     # asyncio.Task running the scheduler loop
+    wake = None     # asyncio.Event set when an earlier deadline is scheduled
+    running = None  # Set of asyncio.Tasks running callbacks, kept referenced until they finish
+
+    def __init__(self):
+        '''
+        Initializes an empty scheduler. The scheduler task starts with the first scheduled callback.
+        '''
+        self.heap = []
+        self.counter = itertools.count()
+        self.task = None
+        self.wake = None
+        self.running = set()
+
+    def __len__(self):
+        return sum(1 for _, _, handle in self.heap if not handle.cancelled)
+
+    def call_at(self, deadline, callback, *args):
+        '''
+        Schedules the callback to run at the given monotonic() time
+        INPUT
+            deadline; monotonic() time at which to run the callback
+            callback; coroutine function or function to call
+            args; arguments for the callback
+        RETURNS
+            TimerHandle for cancelling the callback
+        '''
+        handle = TimerHandle(deadline, callback, args)
+        heapq.heappush(self.heap, (deadline, next(self.counter), handle))
+        if self.task is None or self.task.done():
+            self.wake = asyncio.Event()
+            self.task = asyncio.create_task(self.run())
+        elif self.heap[0][2] is handle:
+            self.wake.set()
+        return handle
+
+    def call_later(self, delay, callback, *args):
+        '''
+        Schedules the callback to run after the given number of seconds
+        INPUT
+            delay; seconds to wait before running the callback
+            callback; coroutine function or function to call
+            args; arguments for the callback
+        RETURNS
+            TimerHandle for cancelling the callback
+        '''
+        return self.call_at(monotonic() + delay, callback, *args)
+
+    async def run(self):
+        '''
+        Runs each callback once its deadline passes. Stops when no callbacks remain.
+        '''
+        while self.heap:
+            # Drop cancelled timers at the top of the heap
+            deadline, _, handle = self.heap[0]
+            if handle.cancelled:
+                heapq.heappop(self.heap)
+                continue
+
+            # Sleep until the earliest deadline or until an earlier one is scheduled
+            delay = deadline - monotonic()
+            if delay > 0:
+                self.wake.clear()
+                try:
+                    await asyncio.wait_for(self.wake.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self.heap)
+            task = asyncio.create_task(self.fire(handle))
+            self.running.add(task)
+            task.add_done_callback(self.running.discard)
+
+    async def fire(self, handle):
+        '''
+        Runs the callback of the given timer, reporting any error to the terminal
+        INPUT
+            handle; TimerHandle to run
+        '''
+        if handle.cancelled:
+            return
+        try:
+            result = handle.callback(*handle.args)
+            if asyncio.iscoroutine(result):
+                await result
+        except Exception as e:
+            print(f"Scheduled callback {handle.callback.__qualname__} failed: {e!r}")
+
+# Scheduler shared by all games
+SCHEDULER = DeadlineScheduler()
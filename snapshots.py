@@ -0,0 +1,308 @@
+"""
+Crash-safe snapshots of ongoing games in the local SQLite database.
+
+A game is snapshotted right away when it changes phase, and at most once per DEBOUNCE_SECONDS within a phase.
+Snapshots are written by one background task, off the message handlers' path.
+On startup, restore_games() rebuilds the snapshotted games and reschedules their phase timers.
+Setting WITNESS_SNAPSHOTS=0 turns snapshots off, for example in headless load tests.
+"""
+
+import asyncio
+import json
+import os
+import zlib
+from time import monotonic, time
+import storage
+from scheduler import SCHEDULER
+
+# Version of the snapshot format. Snapshots of other versions are discarded on restore.
+SNAPSHOT_VERSION = 1
+
+# Whether games are snapshotted at all
+ENABLED = os.getenv("WITNESS_SNAPSHOTS", "1") != "0"
+
+# Seconds to wait before snapshotting a change within a phase
+DEBOUNCE_SECONDS = 5
+
+_pending = {}       # Dictionary mapping category ids to the encoded snapshot (or None to delete) awaiting the writer
+_debounced = {}     # Dictionary mapping category ids to the TimerHandle of their debounced snapshot
+_writer = None      # asyncio.Task writing pending snapshots
+
+def create_table(conn):
+    '''
+    Creates the game_snapshots table if needed
+    INPUT
+        conn; sqlite3 connection
+    '''
+    conn.execute("CREATE TABLE IF NOT EXISTS game_snapshots ("
+                 "category_id INTEGER PRIMARY KEY, "
+                 "guild_id INTEGER NOT NULL, "
+                 "version INTEGER NOT NULL, "
+                 "updated REAL NOT NULL, "
+                 "data BLOB NOT NULL)")
+
+def snapshot_game(game):
+    '''
+    RETURNS a JSON-serializable dictionary describing the game
+    INPUT
+        game; Game object
+    '''
+    state = game.gamestate
+    witness = game.gpt_witness
+    settings = dict(game.settings)
+    settings["specialroles"] = sorted(settings["specialroles"])
+    snapshot = {"version": SNAPSHOT_VERSION,
+                "guild_id": game.category.guild.id,
+                "category_id": game.category.id,
+                "registration_channel_id": game.registration_msg.channel.id,
+                "registration_msg_id": game.registration_msg.id,
+                "settings": settings,
+                "players": [{"user_id": ply.user.id,
+                             "channel_id": ply.channel.id,
+                             "role": ply.role.title if ply.role is not None else None,
+                             "power_activated": ply.role.power_activated if ply.role is not None else 0}
+                            for ply in game.player_list],
+                "keyword": game.keyword,
+                "questioner": game.questioner,
+                "powers": game.powers,
+                "witness": None,
+                "phase": type(state).__name__,
+                "elapsed": monotonic() - state.start,
+                "time_limit": state.time_limit,
+                "phase_end_message": state.phase_end_message}
+    if witness is not None:
+        snapshot["witness"] = {"keyword": witness.keyword,
+                               "n_words": witness.n_words,
+                               "banned_words": witness.banned_words,
+                               "questions": witness.witness_questions,
+                               "responses": witness.witness_responses}
+    if getattr(state, "previous_guess_time", None) is not None:
+        snapshot["cooldown_elapsed"] = monotonic() - state.previous_guess_time
+    if getattr(state, "votes", None) is not None:
+        snapshot["votes"] = state.votes
+    return snapshot
+
+def encode(snapshot):
+    '''
+    RETURNS the snapshot as compressed JSON bytes
+    INPUT
+        snapshot; dictionary from snapshot_game()
+    '''
+    return zlib.compress(json.dumps(snapshot, separators=(",", ":")).encode("utf-8"))
+
+def decode(data):
+    '''
+    RETURNS the snapshot dictionary stored as compressed JSON bytes
+    INPUT
+        data; bytes from encode()
+    '''
+    return json.loads(zlib.decompress(data).decode("utf-8"))
+
+def write_snapshots(batch):
+    '''
+    Writes or deletes a batch of snapshots in one transaction
+    INPUT
+        batch; dictionary mapping category ids to (guild id, encoded snapshot), or to None to delete the snapshot
+    '''
+    with storage.connect() as conn:
+        create_table(conn)
+        for category_id, entry in batch.items():
+            if entry is None:
+                conn.execute("DELETE FROM game_snapshots WHERE category_id = ?", (category_id,))
+            else:
+                conn.execute("INSERT OR REPLACE INTO game_snapshots VALUES (?, ?, ?, ?, ?)",
+                             (category_id, entry[0], SNAPSHOT_VERSION, time(), entry[1]))
+
+def load_snapshots():
+    '''
+    RETURNS list of all stored snapshot dictionaries of the current version
+    '''
+    with storage.connect() as conn:
+        create_table(conn)
+        rows = conn.execute("SELECT data FROM game_snapshots WHERE version = ?", (SNAPSHOT_VERSION,)).fetchall()
+        conn.execute("DELETE FROM game_snapshots WHERE version != ?", (SNAPSHOT_VERSION,))
+    return [decode(row[0]) for row in rows]
+
+async def run_writer():
+    '''
+    Writes pending snapshots in batches until none are left
+    '''
+    global _pending, _writer
+    try:
+        while _pending:
+            batch = _pending
+            _pending = {}
+            try:
+                await asyncio.to_thread(write_snapshots, batch)
+            except Exception as e:
+                print(f"Failed to write game snapshots: {e!r}")
+    finally:
+        _writer = None
+
+def queue_write(category_id, entry):
+    '''
+    Queues a snapshot write for the background writer
+    INPUT
+        category_id; integer Discord category id of the game
+        entry; tuple of (guild id, encoded snapshot), or None to delete the snapshot
+    '''
+    global _writer
+    _pending[category_id] = entry
+    if _writer is None:
+        _writer = asyncio.create_task(run_writer())
+
+def save_now(game):
+    '''
+    Snapshots the game now, for example after a phase change
+    INPUT
+        game; Game object
+    '''
+    timer = _debounced.pop(game.category.id, None)
+    if timer is not None:
+        timer.cancel()
+    if not ENABLED or game.ended or game.gamestate is None:
+        return
+    try:
+        queue_write(game.category.id, (game.category.guild.id, encode(snapshot_game(game))))
+    except Exception as e:
+        print(f"Failed to snapshot {game.category}: {e!r}")
+
+def mark_dirty(game):
+    '''
+    Snapshots the game within DEBOUNCE_SECONDS, merging further changes made in the meantime
+    INPUT
+        game; Game object
+    '''
+    if ENABLED and game.category.id not in _debounced:
+        _debounced[game.category.id] = SCHEDULER.call_later(DEBOUNCE_SECONDS, save_now, game)
+
+async def flush():
+    '''
+    Writes the debounced and pending snapshots now, for example before shutting down
+    '''
+    for timer in list(_debounced.values()):
+        save_now(*timer.args)
+    if _writer is not None:
+        await asyncio.shield(_writer)
+
+def forget(game):
+    '''
+    Deletes the game's snapshot, for example once the game ended
+    INPUT
+        game; Game object
+    '''
+    timer = _debounced.pop(game.category.id, None)
+    if timer is not None:
+        timer.cancel()
+    if ENABLED:
+        queue_write(game.category.id, None)
+
+async def restore_game(client, snapshot):
+    '''
+    RETURNS the Game rebuilt from the snapshot with its phase timers rescheduled, or None if its Discord objects are gone
+    INPUT
+        client; logged-in Discord client
+        snapshot; dictionary from snapshot_game()
+    '''
+    import gameplay
+    import gamestates as gs
+    import player_roles as pr
+    import word_match
+    from gpt_responder import GptWitness, load_system_instructions
+    from messaging import Outbox
+    from channel_pool import ChannelPool
+
+    guild = client.get_guild(snapshot["guild_id"])
+    category = guild.get_channel(snapshot["category_id"]) if guild is not None else None
+    registration_channel = guild.get_channel(snapshot["registration_channel_id"]) if guild is not None else None
+    if category is None or registration_channel is None:
+        return None
+
+    # Rebuild the game
+    game = gameplay.Game()
+    game.category = category
+    game.channel_pool = ChannelPool(category)
+    game.registration_msg = registration_channel.get_partial_message(snapshot["registration_msg_id"])
+    game.player_list = []
+    game.players_by_id = {}
+    game.players_by_name = {}
+    game.settings = dict(snapshot["settings"])
+    game.settings["specialroles"] = set(game.settings["specialroles"])
+    game.keyword = snapshot["keyword"]
+    game.keyword_signature = word_match.match_signature(game.keyword) if game.keyword else None
+    game.questioner = snapshot["questioner"]
+    game.powers = snapshot["powers"]
+    game.usage = {}
+    game.ended = False
+    game.last_activity = monotonic()
+
+    # Rebuild the players and their roles
+    for entry in snapshot["players"]:
+        user = guild.get_member(entry["user_id"]) or await client.fetch_user(entry["user_id"])
+        channel = guild.get_channel(entry["channel_id"])
+        if channel is None:
+            return None
+        ply = gameplay.Player()
+        ply.user = user
+        ply.game = game
+        ply.channel = channel
+        ply.outbox = Outbox(channel)
+        if entry["role"] is not None:
+            ply.role = pr.ROLE_REGISTRY[entry["role"].lower()].role_class.initialize(ply)
+            ply.role.power_activated = entry["power_activated"]
+        game.player_list.append(ply)
+        game.players_by_id[user.id] = ply
+        game.players_by_name[user.name] = ply
+
+    # Rebuild the WITNESS
+    if snapshot["witness"] is not None:
+        witness = GptWitness()
+        witness.game = game
+        witness.keyword = snapshot["witness"]["keyword"]
+        witness.n_words = snapshot["witness"]["n_words"]
+        witness.verbose = True
+        witness.banned_words = snapshot["witness"]["banned_words"]
+        witness.witness_questions = snapshot["witness"]["questions"]
+        witness.witness_responses = snapshot["witness"]["responses"]
+        witness.usage = {}
+        witness.system_instructions = load_system_instructions()
+        game.gpt_witness = witness
+
+    # Rebuild the phase. Time spent offline does not count against the time limit.
+    state = getattr(gs, snapshot["phase"])()
+    state.game = game
+    state.start = monotonic() - snapshot["elapsed"]
+    state.time_limit = snapshot["time_limit"]
+    state.phase_end_message = snapshot["phase_end_message"]
+    state.timers = []
+    if "cooldown_elapsed" in snapshot:
+        state.previous_guess_time = monotonic() - snapshot["cooldown_elapsed"]
+    if "votes" in snapshot:
+        state.votes = snapshot["votes"]
+    game.gamestate = state
+    if isinstance(state, gs.GameStateCreation):
+        state.start_prewarm()
+    else:
+        state.start_timer()
+    return game
+
+async def restore_games(client, games):
+    '''
+    Rebuilds every snapshotted game, registers it and tells its players it was restored
+    INPUT
+        client; logged-in Discord client
+        games; GameManager to register the restored games in
+    '''
+    for snapshot in await asyncio.to_thread(load_snapshots):
+        if games.owns_category(snapshot["category_id"]):
+            continue
+        try:
+            game = await restore_game(client, snapshot)
+        except Exception as e:
+            print(f"Failed to restore game in category {snapshot['category_id']}: {e!r}")
+            game = None
+        if game is None:
+            queue_write(snapshot["category_id"], None)
+            continue
+        games.add(game)
+        await game.send_global_message(f"The bot restarted. This game was restored in the {type(game.gamestate).__name__[len('GameState'):]} phase.")
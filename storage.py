@@ -0,0 +1,33 @@
+"""
+Local SQLite storage shared by the bot's caches and logs.
+Each thread keeps one open connection per database file, so queries run from asyncio.to_thread workers
+neither reopen the file nor repeat the connection PRAGMAs.
+"""
+
+import os
+import sqlite3
+import threading
+
+# Path of the local SQLite database
+DB_PATH = os.getenv("WITNESS_DB", "witness.sqlite3")
+
+_local = threading.local()  # Per-thread dictionary of open connections, as _local.connections, keyed by database path
+
+def connect(path=None):
+    '''
+    RETURNS this thread's sqlite3 connection to the local database, opening it on first use.
+    Use it as "with storage.connect() as conn:", which commits on success and rolls back on an error. Do not close it.
+    INPUT
+        path; optional path of the database file. Defaults to DB_PATH.
+    '''
+    path = path or DB_PATH
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        connections[path] = conn
+    return conn
@@ -0,0 +1,24 @@
+"""
+Shared fixtures. Tests play the real game modules against the headless stand-ins for Discord and OpenAI.
+"""
+
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import headless
+import gameplay     # Imported before gamestates, as gamestates and gpt_responder import each other through it
+
+@pytest.fixture
+def game_modules(monkeypatch):
+    '''
+    Points the game modules at the headless stand-ins for one test, run from the repository root
+    RETURNS the temporary directory holding the test's database and event log
+    '''
+    monkeypatch.chdir(ROOT)
+    directory = headless.install()
+    yield directory
+    headless.uninstall()
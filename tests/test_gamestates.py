@@ -0,0 +1,88 @@
+"""
+Starting a game, and phase changes racing the phase time limit.
+"""
+
+import asyncio
+import random
+import gameplay
+import gamestates as gs
+import gpt_responder
+import headless
+import keyword_deck
+from headless import Bot, FakeGuild, FakeMessage
+
+async def start_game(n_players=3):
+    '''
+    RETURNS a Bot whose game has just reached Questioning
+    '''
+    bot = Bot(FakeGuild(), n_players, random.Random(1))
+    bot.game = await gameplay.Game.initialize(FakeMessage("$play", bot.users[0], bot.guild.lobby))
+    for user in bot.users[1:]:
+        await bot.game.add_player(user)
+    await bot.say(bot.users[0], "$start")
+    assert isinstance(bot.game.gamestate, gs.GameStateQuestion)
+    return bot
+
+def test_start_recovers_from_failed_keyword_draw(game_modules, monkeypatch):
+    draw_keyword = keyword_deck.draw_keyword
+    failures = [RuntimeError("database is locked")]
+    async def flaky_draw_keyword(guild_id):
+        if failures:
+            raise failures.pop()
+        return await draw_keyword(guild_id)
+    monkeypatch.setattr(keyword_deck, "draw_keyword", flaky_draw_keyword)
+
+    async def scenario():
+        bot = Bot(FakeGuild(), 2, random.Random(1))
+        bot.game = await gameplay.Game.initialize(FakeMessage("$play", bot.users[0], bot.guild.lobby))
+        await bot.game.add_player(bot.users[1])
+        host = bot.game.player_list[0]
+        await bot.say(bot.users[0], "$start")
+        assert isinstance(bot.game.gamestate, gs.GameStateCreation)
+        await host.outbox.flush()
+        assert "try again" in host.channel.last_message
+        await bot.say(bot.users[0], "$start")
+        assert isinstance(bot.game.gamestate, gs.GameStateQuestion)
+        await bot.close()
+    asyncio.run(scenario())
+
+def test_deadline_and_last_vote_conclude_once(game_modules, monkeypatch):
+    concluded = []
+    conclude = gs.GameState.conclude
+    async def counting_conclude(self):
+        concluded.append(self)
+        await conclude(self)
+    monkeypatch.setattr(gs.GameState, "conclude", counting_conclude)
+
+    async def scenario():
+        bot = await start_game()
+        await bot.say(bot.questioner(), "$readytoguess")
+        await bot.say(bot.questioner(), "$guess " + " ".join("nothing" for _ in bot.game.keyword.split()))
+        trial = bot.game.gamestate
+        assert isinstance(trial, gs.GameStateTrial)
+        names = [user.name for user in bot.users]
+        for user in bot.users[:-1]:
+            await bot.say(user, names[0])
+
+        # The time limit is reached while the last vote comes in
+        await asyncio.gather(trial.on_deadline(), bot.say(bot.users[-1], names[0]))
+        assert concluded == [trial]
+        assert isinstance(bot.game.gamestate, gs.GameStateCreation)
+        await bot.close()
+    asyncio.run(scenario())
+
+def test_deadline_during_ask_does_not_deal_words(game_modules, monkeypatch):
+    async def slow_chat_completion(**kwargs):
+        await asyncio.sleep(0.01)
+        return await headless.fake_chat_completion(**kwargs)
+    monkeypatch.setattr(gpt_responder, "create_chat_completion", slow_chat_completion)
+
+    async def scenario():
+        bot = await start_game()
+        question = bot.game.gamestate
+        questioner = bot.game.questioner
+        await asyncio.gather(bot.say(bot.questioner(), "$ask is it slow to answer"), question.on_deadline())
+        assert isinstance(bot.game.gamestate, gs.GameStateGuess)
+        assert bot.game.questioner == questioner
+        await bot.close()
+    asyncio.run(scenario())
@@ -0,0 +1,45 @@
+"""
+Keyword decks: no repeats until a deck is used up, over pictionary_words.txt or a corpus, and persisted positions.
+"""
+
+import asyncio
+import corpus
+import keyword_deck
+from keyword_deck import KeywordDeck, Permutation
+
+def test_permutation_is_a_bijection():
+    for size in list(range(1, 130)) + [1000, 4097]:
+        order = Permutation(size, seed=size)
+        assert sorted(order[i] for i in range(size)) == list(range(size))
+
+def test_corpus_deck_does_not_repeat(game_modules, monkeypatch, tmp_path):
+    path = str(tmp_path / "keywords.bin")
+    corpus.build([(f"animal{i}", "animals", 1) for i in range(30)] + [(f"food{i}", "foods", 2) for i in range(20)], path)
+    monkeypatch.setattr(keyword_deck, "CORPUS_PATH", path)
+    monkeypatch.setattr(keyword_deck, "_large_corpus", None)
+    monkeypatch.setattr(keyword_deck, "_views", {})
+    monkeypatch.setattr(keyword_deck, "_decks", {})
+
+    async def scenario():
+        everything = [await keyword_deck.draw_keyword(1, None, None) for _ in range(50)]
+        assert len(set(everything)) == 50
+        foods = [await keyword_deck.draw_keyword(1, "foods", None) for _ in range(20)]
+        assert sorted(foods) == sorted(f"food{i}" for i in range(20))
+        assert await keyword_deck.draw_keyword(1, "nothing", None) in keyword_deck.get_corpus()
+    asyncio.run(scenario())
+    keyword_deck.get_large_corpus().close()
+
+def test_deck_resumes_from_stored_position(game_modules, monkeypatch):
+    monkeypatch.setattr(keyword_deck, "PERSIST_DECKS", True)
+    monkeypatch.setattr(keyword_deck, "_decks", {})
+
+    async def scenario():
+        return [await keyword_deck.draw_keyword(7, None, None) for _ in range(5)]
+    drawn = asyncio.run(scenario())
+
+    # After a restart, the deck continues where it stopped
+    monkeypatch.setattr(keyword_deck, "_decks", {})
+    deck = keyword_deck.load_deck(7)
+    assert deck.position == 5
+    rest = [deck.draw() for _ in range(len(deck.order) - 5)]
+    assert sorted(drawn + rest) == sorted(keyword_deck.get_corpus())
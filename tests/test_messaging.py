@@ -0,0 +1,87 @@
+"""
+Outbox merging, failure reporting and retries.
+"""
+
+import asyncio
+import discord
+import pytest
+import messaging
+from messaging import Outbox
+
+class FlakyChannel:
+    '''
+    Channel whose sends raise the queued errors before succeeding
+    '''
+
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.sent = []
+
+    async def send(self, content):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append(content)
+
+class NotFoundResponse:
+    status = 404
+    reason = "Not Found"
+
+def test_merges_messages_queued_together():
+    async def scenario():
+        channel = FlakyChannel()
+        outbox = Outbox(channel, linger=0)
+        outbox.queue("hi")
+        outbox.queue("again")
+        await outbox.flush()
+        assert channel.sent == ["hi\nagain"]
+    asyncio.run(scenario())
+
+def test_temporary_failure_is_raised_and_retried(monkeypatch, capsys):
+    monkeypatch.setattr(messaging, "OUTBOX_RETRY_DELAY", 0.01)
+    async def scenario():
+        channel = FlakyChannel([RuntimeError("rate limited")])
+        outbox = Outbox(channel, linger=0)
+        outbox.queue("hi")
+        with pytest.raises(RuntimeError):
+            await outbox.flush()
+        assert channel.sent == []
+        outbox.queue("again")
+        await asyncio.sleep(0.05)
+        assert channel.sent == ["hi\nagain"]
+        assert outbox.task is None
+    asyncio.run(scenario())
+    assert "rate limited" in capsys.readouterr().out
+
+def test_gives_up_after_repeated_failures(monkeypatch):
+    monkeypatch.setattr(messaging, "OUTBOX_RETRY_DELAY", 0)
+    async def scenario():
+        channel = FlakyChannel([RuntimeError("down")] * (messaging.OUTBOX_RETRIES + 1))
+        outbox = Outbox(channel, linger=0)
+        outbox.queue("hi")
+        await asyncio.sleep(0.05)
+        assert outbox.pending == [] and outbox.task is None
+        assert channel.sent == []
+    asyncio.run(scenario())
+
+def test_permanent_failure_drops_backlog():
+    async def scenario():
+        channel = FlakyChannel([discord.NotFound(NotFoundResponse(), "Unknown Channel")])
+        outbox = Outbox(channel, linger=0)
+        outbox.queue("hi")
+        with pytest.raises(discord.NotFound):
+            await outbox.flush()
+        assert outbox.pending == [] and outbox.task is None
+        outbox.queue("later")
+        await outbox.flush()
+        assert channel.sent == ["later"]
+    asyncio.run(scenario())
+
+def test_backlog_is_capped(monkeypatch):
+    monkeypatch.setattr(messaging, "OUTBOX_MAX_PENDING", 5)
+    async def scenario():
+        outbox = Outbox(FlakyChannel(), linger=60)
+        for i in range(10):
+            outbox.queue(str(i))
+        assert outbox.pending == ["5", "6", "7", "8", "9"]
+        outbox.close()
+    asyncio.run(scenario())
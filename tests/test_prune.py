@@ -0,0 +1,54 @@
+"""
+$prune never deletes a live game's category, and resumes interrupted jobs from the stored categories.
+"""
+
+import asyncio
+import headless
+import gameplay
+import prune
+from game_registry import GameManager
+from headless import FakeChannel, FakeGuild, FakeMessage, FakeUser
+
+class FakeClient:
+    '''
+    Stand-in for the Discord client, knowing one guild
+    '''
+
+    def __init__(self, guild):
+        self.guild = guild
+
+    def get_guild(self, guild_id):
+        return self.guild if guild_id == self.guild.id else None
+
+def test_prune_spares_game_being_set_up(game_modules, monkeypatch):
+    send = FakeChannel.send
+    async def slow_send(self, content):
+        await asyncio.sleep(0.01)
+        return await send(self, content)
+    monkeypatch.setattr(FakeChannel, "send", slow_send)
+
+    async def scenario():
+        guild = FakeGuild()
+        games = GameManager()
+        leftover = await guild.create_category("Witness-0001")
+        setup = asyncio.create_task(gameplay.Game.initialize(FakeMessage("$play", FakeUser("host"), guild.lobby), games))
+        await asyncio.sleep(0)     # The category exists, and the registration message is being sent
+        await prune.PruneJob(guild, games).run()
+        game = await setup
+        games.add(game)
+        assert guild.categories == [game.category]
+        assert leftover not in guild.categories
+        assert not games.reserved
+        game.end()
+    asyncio.run(scenario())
+
+def test_resume_deletes_only_stored_categories(game_modules):
+    async def scenario():
+        guild = FakeGuild()
+        categories = [await guild.create_category(f"Witness-{i}") for i in range(4)]
+        prune.save_pending(guild.id, [categories[0].id, categories[1].id, 999])
+        await prune.resume_pending(FakeClient(guild), GameManager())
+        await asyncio.gather(*[job.task for job in list(prune._jobs.values())])
+        assert guild.categories == categories[2:]
+        assert prune.load_pending() == {}
+    asyncio.run(scenario())
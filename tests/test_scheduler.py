@@ -0,0 +1,34 @@
+"""
+DeadlineScheduler ordering, cancellation and error handling.
+"""
+
+import asyncio
+from scheduler import DeadlineScheduler
+
+def test_runs_callbacks_in_deadline_order():
+    async def scenario():
+        scheduler = DeadlineScheduler()
+        fired = []
+        async def record(name):
+            fired.append(name)
+        scheduler.call_later(0.03, record, "late")
+        scheduler.call_later(0.01, fired.append, "early")
+        scheduler.call_later(0.02, record, "middle")
+        await asyncio.sleep(0.06)
+        assert fired == ["early", "middle", "late"]
+        assert len(scheduler) == 0 and not scheduler.running
+    asyncio.run(scenario())
+
+def test_cancelled_and_failing_callbacks():
+    async def scenario():
+        scheduler = DeadlineScheduler()
+        fired = []
+        def fail():
+            raise RuntimeError("broken callback")
+        scheduler.call_later(0.01, fail)
+        scheduler.call_later(0.02, fired.append, "cancelled").cancel()
+        scheduler.call_later(0.03, fired.append, "after")
+        assert len(scheduler) == 2
+        await asyncio.sleep(0.06)
+        assert fired == ["after"]
+    asyncio.run(scenario())
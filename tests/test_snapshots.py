@@ -0,0 +1,74 @@
+"""
+Snapshots round trip through the database and restore a game that can be played on.
+"""
+
+import asyncio
+import random
+import gameplay
+import gamestates as gs
+import snapshots
+from game_registry import GameManager
+from headless import Bot, FakeGuild, FakeMessage
+
+class FakeClient:
+    '''
+    Stand-in for the Discord client after a restart, knowing one guild and its players
+    '''
+
+    def __init__(self, guild, users):
+        self.guild = guild
+        self.users = {user.id: user for user in users}
+
+    def get_guild(self, guild_id):
+        return self.guild if guild_id == self.guild.id else None
+
+    async def fetch_user(self, user_id):
+        return self.users[user_id]
+
+def test_encode_round_trip():
+    snapshot = {"version": snapshots.SNAPSHOT_VERSION, "votes": {"a": "b"}, "settings": {"specialroles": ["villain"]}}
+    assert snapshots.decode(snapshots.encode(snapshot)) == snapshot
+
+def test_restored_trial_plays_on(game_modules, monkeypatch):
+    monkeypatch.setattr(snapshots, "ENABLED", True)
+
+    async def scenario():
+        # Play into the Trial phase, with one vote cast
+        bot = Bot(FakeGuild(), 3, random.Random(1))
+        bot.game = await gameplay.Game.initialize(FakeMessage("$play", bot.users[0], bot.guild.lobby))
+        for user in bot.users[1:]:
+            await bot.game.add_player(user)
+        await bot.say(bot.users[0], "$role add villain")
+        await bot.say(bot.users[0], "$start")
+        await bot.say(bot.questioner(), "$ask what is it")
+        await bot.say(bot.questioner(), "$readytoguess")
+        await bot.say(bot.questioner(), "$guess " + " ".join("nothing" for _ in bot.game.keyword.split()))
+        names = [user.name for user in bot.users]
+        await bot.say(bot.users[0], names[1])
+        game = bot.game
+        assert isinstance(game.gamestate, gs.GameStateTrial)
+        snapshots.save_now(game)
+        await snapshots.flush()
+
+        # The bot restarts: the old game's timers stop, and the game is rebuilt from the database
+        game.gamestate.cancel_timers()
+        games = GameManager()
+        await snapshots.restore_games(FakeClient(bot.guild, bot.users), games)
+        restored = games.for_channel(game.player_list[0].channel)
+        assert restored is not None and restored is not game
+        assert isinstance(restored.gamestate, gs.GameStateTrial)
+        assert restored.gamestate.votes == {names[0]: names[1]}
+        assert restored.keyword == game.keyword
+        assert restored.settings == game.settings
+        assert [ply.role.title for ply in restored.player_list] == [ply.role.title for ply in game.player_list]
+        assert restored.gpt_witness.banned_words == game.gpt_witness.banned_words
+        assert restored.gpt_witness.witness_questions == game.gpt_witness.witness_questions
+        assert restored.gamestate.get_remaining_time() <= game.gamestate.get_remaining_time()
+
+        # The restored game finishes the Trial and starts a new game
+        bot.game = restored
+        for user in bot.users[1:]:
+            await bot.say(user, names[1])
+        assert isinstance(restored.gamestate, gs.GameStateCreation)
+        await bot.close()
+    asyncio.run(scenario())
@@ -0,0 +1,227 @@
+"""
+OpenAI token usage accounting by game category, guild and call type ("banned_words" or "ask").
+Usage is rolled up in memory and added to the local SQLite database every FLUSH_INTERVAL seconds.
+Each row also records the settings that drive token use (numbannedwords and max_tokens),
+so the report shows what each setting costs.
+
+Run as a script for an admin report:
+    python usage.py report --days 7 --by guild
+"""
+
+import argparse
+import asyncio
+import os
+from time import gmtime, strftime, time
+import storage
+from scheduler import SCHEDULER
+
+# OpenAI call types
+CALL_TYPES = ("banned_words", "ask")
+
+# Seconds between flushes of the in-memory counters to the database
+FLUSH_INTERVAL = int(os.getenv("USAGE_FLUSH_INTERVAL", 60))
+
+# US dollars per 1000 tokens, for the cost estimates in reports. Defaults are gpt-3.5-turbo prices.
+PROMPT_PRICE = float(os.getenv("OPENAI_PROMPT_PRICE", 0.0015))
+COMPLETION_PRICE = float(os.getenv("OPENAI_COMPLETION_PRICE", 0.002))
+
+# Columns a report can be grouped by. "category" adds up every game played in one Discord category.
+REPORT_GROUPS = {"category": "guild_id, category_id",
+                 "guild": "guild_id",
+                 "day": "day",
+                 "settings": "numbannedwords, max_tokens"}
+
+class UsageCounter:
+    '''
+    Running totals of OpenAI calls and tokens.
+    '''
+
+    calls = None                # Number of calls, including answers served from a cache
+    cached = None               # Number of calls answered from a cache without using tokens
+    prompt_tokens = None        # Number of prompt tokens used
+    completion_tokens = None    # Number of completion tokens used
+
+    def __init__(self, calls=0, cached=0, prompt_tokens=0, completion_tokens=0):
+        self.calls = calls
+        self.cached = cached
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+
+    def add(self, usage):
+        '''
+        Counts one call
+        INPUT
+            usage; the "usage" dictionary of an OpenAI response, or None if the call was answered from a cache
+        '''
+        self.calls += 1
+        if usage is None:
+            self.cached += 1
+        else:
+            self.prompt_tokens += usage["prompt_tokens"]
+            self.completion_tokens += usage["completion_tokens"]
+
+    def total_tokens(self):
+        return self.prompt_tokens + self.completion_tokens
+
+    def tokens_per_call(self):
+        '''
+        RETURNS average tokens per call that reached OpenAI, or 0 if none did
+        '''
+        requests = self.calls - self.cached
+        return self.total_tokens() / requests if requests else 0
+
+    def cost(self):
+        '''
+        RETURNS estimated US dollar cost of the tokens
+        '''
+        return (self.prompt_tokens * PROMPT_PRICE + self.completion_tokens * COMPLETION_PRICE) / 1000
+
+_pending = {}           # Dictionary mapping (day, guild id, category id, call type, numbannedwords, max_tokens) to a UsageCounter not yet flushed
+_flush_timer = None     # TimerHandle of the next flush, or None if nothing is pending
+
+def record(game, call_type, usage, max_tokens, n_words, counters=None):
+    '''
+    Counts one OpenAI call towards the game's totals and the pending database totals
+    INPUT
+        game; Game object that made the call, or None for calls outside a game (e.g. populating the banned words cache)
+        call_type; string call type from CALL_TYPES
+        usage; the "usage" dictionary of the OpenAI response, or None if the call was answered from a cache
+        max_tokens; max_tokens of the request
+        n_words; numbannedwords of the request
+        counters; dictionary mapping call types to UsageCounter objects to count the call towards instead of game.usage,
+            e.g. for a GptWitness prepared before the game that will use it has started
+    '''
+    global _flush_timer
+    if counters is None and game is not None:
+        counters = game.usage
+    if counters is not None:
+        counters.setdefault(call_type, UsageCounter()).add(usage)
+    if game is not None:
+        key = (strftime("%Y-%m-%d", gmtime()), game.category.guild.id, game.category.id, call_type, n_words, max_tokens)
+    else:
+        key = (strftime("%Y-%m-%d", gmtime()), 0, 0, call_type, n_words, max_tokens)
+    _pending.setdefault(key, UsageCounter()).add(usage)
+    if _flush_timer is None:
+        _flush_timer = SCHEDULER.call_later(FLUSH_INTERVAL, flush)
+
+def create_table(conn):
+    '''
+    Creates the openai_usage table if needed
+    INPUT
+        conn; sqlite3 connection
+    '''
+    conn.execute("CREATE TABLE IF NOT EXISTS openai_usage ("
+                 "day TEXT NOT NULL, "
+                 "guild_id INTEGER NOT NULL, "
+                 "category_id INTEGER NOT NULL, "
+                 "call_type TEXT NOT NULL, "
+                 "numbannedwords INTEGER NOT NULL, "
+                 "max_tokens INTEGER NOT NULL, "
+                 "calls INTEGER NOT NULL, "
+                 "cached INTEGER NOT NULL, "
+                 "prompt_tokens INTEGER NOT NULL, "
+                 "completion_tokens INTEGER NOT NULL, "
+                 "updated REAL NOT NULL, "
+                 "PRIMARY KEY (day, guild_id, category_id, call_type, numbannedwords, max_tokens))")
+
+def write_usage(batch):
+    '''
+    Adds a batch of counters to the stored totals in one transaction
+    INPUT
+        batch; dictionary mapping keys as in _pending to UsageCounter objects
+    '''
+    with storage.connect() as conn:
+        create_table(conn)
+        conn.executemany("INSERT INTO openai_usage VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                         "ON CONFLICT (day, guild_id, category_id, call_type, numbannedwords, max_tokens) DO UPDATE SET "
+                         "calls = calls + excluded.calls, "
+                         "cached = cached + excluded.cached, "
+                         "prompt_tokens = prompt_tokens + excluded.prompt_tokens, "
+                         "completion_tokens = completion_tokens + excluded.completion_tokens, "
+                         "updated = excluded.updated",
+                         [key + (counter.calls, counter.cached, counter.prompt_tokens, counter.completion_tokens, time())
+                          for key, counter in batch.items()])
+
+async def flush():
+    '''
+    Adds the pending counters to the database
+    '''
+    global _pending, _flush_timer
+    batch = _pending
+    _pending = {}
+    if _flush_timer is not None:
+        _flush_timer.cancel()
+        _flush_timer = None
+    if not batch:
+        return
+    try:
+        await asyncio.to_thread(write_usage, batch)
+    except Exception as e:
+        print(f"Failed to write OpenAI usage: {e!r}")
+
+def summarize_game(game):
+    '''
+    RETURNS string summary of the OpenAI usage of the game, for the $usage command
+    INPUT
+        game; Game object
+    '''
+    counters = {call_type: game.usage[call_type] for call_type in CALL_TYPES if call_type in game.usage}
+    if not counters:
+        return "This game has not used OpenAI yet."
+    lines = ["OpenAI usage by this game:"]
+    for call_type, counter in counters.items():
+        lines.append(f"`{call_type}` \t {counter.calls} calls ({counter.cached} cached) \t "
+                     f"{counter.prompt_tokens} prompt + {counter.completion_tokens} completion tokens \t "
+                     f"{counter.tokens_per_call():.0f} tokens per call")
+    total = UsageCounter(sum(counter.calls for counter in counters.values()),
+                         sum(counter.cached for counter in counters.values()),
+                         sum(counter.prompt_tokens for counter in counters.values()),
+                         sum(counter.completion_tokens for counter in counters.values()))
+    questions = game.usage["ask"].calls if "ask" in game.usage else 0
+    lines.append(f"Total \t {total.total_tokens()} tokens (about ${total.cost():.4f})"
+                 + (f" \t {total.total_tokens() / questions:.0f} tokens per question" if questions else ""))
+    return "\n".join(lines)
+
+def load_report(days, by):
+    '''
+    RETURNS list of (group values..., call type, UsageCounter) tuples for the last days days, largest token use first
+    INPUT
+        days; number of days to report, counting today
+        by; grouping from REPORT_GROUPS
+    '''
+    since = strftime("%Y-%m-%d", gmtime(time() - (days - 1) * 86400))
+    columns = REPORT_GROUPS[by]
+    with storage.connect() as conn:
+        create_table(conn)
+        rows = conn.execute(f"SELECT {columns}, call_type, SUM(calls), SUM(cached), SUM(prompt_tokens), SUM(completion_tokens) "
+                            f"FROM openai_usage WHERE day >= ? GROUP BY {columns}, call_type "
+                            f"ORDER BY SUM(prompt_tokens) + SUM(completion_tokens) DESC",
+                            (since,)).fetchall()
+    return [row[:-4] + (UsageCounter(*row[-4:]),) for row in rows]
+
+def format_report(rows, by):
+    '''
+    RETURNS string table of the report rows from load_report()
+    '''
+    header = REPORT_GROUPS[by].replace(", ", " / ")
+    lines = [f"{header:<46} {'call type':<13} {'calls':>8} {'cached':>8} {'prompt':>10} {'completion':>11} {'per call':>9} {'cost $':>9}"]
+    for row in rows:
+        counter = row[-1]
+        group = " / ".join(str(value) for value in row[:-2])
+        lines.append(f"{group:<46} {row[-2]:<13} {counter.calls:>8} {counter.cached:>8} {counter.prompt_tokens:>10} "
+                     f"{counter.completion_tokens:>11} {counter.tokens_per_call():>9.1f} {counter.cost():>9.4f}")
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report OpenAI token usage.")
+    parser.add_argument("command", choices=["report"])
+    parser.add_argument("--days", type=int, default=7, help="number of days to report, counting today")
+    parser.add_argument("--by", choices=list(REPORT_GROUPS), default="guild",
+                        help="group by category (guild / category, every game played there), guild, day or settings (numbannedwords / max_tokens)")
+    args = parser.parse_args()
+
+    rows = load_report(args.days, args.by)
+    if rows:
+        print(format_report(rows, args.by))
+    else:
+        print(f"No OpenAI usage recorded in the last {args.days} days.")
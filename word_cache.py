@@ -0,0 +1,136 @@
+"""
+On-disk cache of the WITNESS's banned words, keyed by keyword and banned word count.
+
+Run as a script to pre-populate the cache for the whole keyword list:
+    python word_cache.py populate --api-base http://localhost:8000/v1
+"""
+
+import argparse
+import asyncio
+import os
+import time
+import storage
+
+# Cached lists older than this many seconds are regenerated
+MAX_AGE = int(os.getenv("BANNED_WORDS_MAX_AGE", 30 * 24 * 3600))
+
+# Maximum number of cached lists. The least recently used lists are evicted past this size.
+MAX_ENTRIES = int(os.getenv("BANNED_WORDS_MAX_ENTRIES", 5000))
+
+class BannedWordsCache:
+    '''
+    SQLite table mapping (keyword, numbannedwords) to a list of banned words.
+    '''
+
+    path = None     # Path of the SQLite database file
+
+    def __init__(self, path=None):
+        '''
+        Initializes this cache, creating its table if needed
+        INPUT
+            path; optional path of the database file. Defaults to storage.DB_PATH.
+        '''
+        self.path = path
+        with storage.connect(self.path) as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS banned_words ("
+                         "keyword TEXT NOT NULL, "
+                         "numbannedwords INTEGER NOT NULL, "
+                         "words TEXT NOT NULL, "
+                         "created REAL NOT NULL, "
+                         "last_used REAL NOT NULL, "
+                         "PRIMARY KEY (keyword, numbannedwords))")
+
+    def get(self, keyword, numbannedwords):
+        '''
+        RETURNS the cached list of banned words, or None if missing or older than MAX_AGE
+        INPUT
+            keyword; string keyword
+            numbannedwords; integer number of banned words
+        '''
+        key = (keyword.lower(), numbannedwords)
+        with storage.connect(self.path) as conn:
+            row = conn.execute("SELECT words, created FROM banned_words WHERE keyword = ? AND numbannedwords = ?",
+                               key).fetchone()
+            if row is None or time.time() - row[1] > MAX_AGE:
+                return None
+            conn.execute("UPDATE banned_words SET last_used = ? WHERE keyword = ? AND numbannedwords = ?",
+                         (time.time(),) + key)
+        return row[0].split()
+
+    def put(self, keyword, numbannedwords, words):
+        '''
+        Stores the list of banned words and evicts the least recently used lists past MAX_ENTRIES
+        INPUT
+            keyword; string keyword
+            numbannedwords; integer number of banned words
+            words; list of string banned words
+        '''
+        now = time.time()
+        with storage.connect(self.path) as conn:
+            conn.execute("INSERT OR REPLACE INTO banned_words VALUES (?, ?, ?, ?, ?)",
+                         (keyword.lower(), numbannedwords, " ".join(words), now, now))
+            conn.execute("DELETE FROM banned_words WHERE rowid IN ("
+                         "SELECT rowid FROM banned_words ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                         (MAX_ENTRIES,))
+
+    async def aget(self, keyword, numbannedwords):
+        '''
+        Awaitable get() that runs off the event loop
+        '''
+        return await asyncio.to_thread(self.get, keyword, numbannedwords)
+
+    async def aput(self, keyword, numbannedwords, words):
+        '''
+        Awaitable put() that runs off the event loop
+        '''
+        await asyncio.to_thread(self.put, keyword, numbannedwords, words)
+
+_cache = None   # Shared BannedWordsCache, created on first use
+
+def get_cache():
+    '''
+    RETURNS the shared BannedWordsCache
+    '''
+    global _cache
+    if _cache is None:
+        _cache = BannedWordsCache()
+    return _cache
+
+async def populate(counts, refresh=False):
+    '''
+    Generates and caches banned words for every keyword in pictionary_words.txt
+    INPUT
+        counts; list of integer numbannedwords values to populate
+        refresh; boolean whether to regenerate lists that are already cached
+    '''
+    from gpt_responder import generate_banned_words
+    import usage
+
+    with open("pictionary_words.txt") as f:
+        keywords = [line.strip() for line in f if line.strip()]
+
+    cache = get_cache()
+    done = 0
+    for keyword in keywords:
+        for n in counts:
+            if refresh or await cache.aget(keyword, n) is None:
+                await cache.aput(keyword, n, await generate_banned_words(keyword, n, verbose=False))
+                done += 1
+    await usage.flush()
+    print(f"Cached {done} banned word lists for {len(keywords)} keywords.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-populate the banned words cache.")
+    parser.add_argument("command", choices=["populate"])
+    parser.add_argument("--counts", type=int, nargs="+", default=[3],
+                        help="numbannedwords values to populate")
+    parser.add_argument("--api-base",
+                        help="base URL of an OpenAI-compatible model to use instead of the OpenAI API")
+    parser.add_argument("--refresh", action="store_true",
+                        help="regenerate lists that are already cached")
+    args = parser.parse_args()
+
+    if args.api_base:
+        os.environ["OPENAI_API_BASE"] = args.api_base
+        os.environ.setdefault("OPENAI_API_KEY", "local")
+    asyncio.run(populate(args.counts, args.refresh))
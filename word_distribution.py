@@ -0,0 +1,42 @@
+"""
+Deals the words of a WITNESS response among the players.
+"""
+
+import random
+from functools import lru_cache
+from itertools import accumulate
+
+def slot_sizes(n_words, n_players):
+    '''
+    RETURNS list of the number of words each player receives. Sizes differ by at most one, larger first.
+    INPUT
+        n_words; integer number of words to deal
+        n_players; integer number of players
+    '''
+    base, extra = divmod(n_words, n_players)
+    return [base + 1] * extra + [base] * (n_players - extra)
+
+@lru_cache(maxsize=256)
+def slot_bounds(n_words, n_players):
+    '''
+    RETURNS tuple of (start, end) index pairs of each player's words, from slot_sizes(). Cached, as games reuse the same sizes.
+    '''
+    ends = list(accumulate(slot_sizes(n_words, n_players)))
+    return tuple(zip([0] + ends[:-1], ends))
+
+def deal(words, n_players, rng=random, censor=False):
+    '''
+    Shuffles the words and deals them among the players
+    INPUT
+        words; list of string words
+        n_players; integer number of players
+        rng; random.Random instance (or the random module) used to shuffle
+        censor; boolean whether the Censorer power is active. If so, each player receives a single word.
+    RETURNS
+        list of n_players lists of string words, with sizes given by slot_sizes()
+    '''
+    words = list(words)
+    rng.shuffle(words)
+    if censor and n_players <= len(words):
+        return [[word] for word in words[:n_players]]
+    return [words[start:end] for start, end in slot_bounds(len(words), n_players)]
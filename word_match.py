@@ -0,0 +1,76 @@
+"""
+Keyword guess matching. A keyword's match signature is computed once when it is chosen,
+so checking a guess is a set comparison.
+"""
+
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+# Normalized tokens of a phrase and the set of forms that a matching guess may share
+MatchSignature = namedtuple("MatchSignature", ["tokens", "forms"])
+
+_stemmer = None # Shared nltk SnowballStemmer, created on first use
+
+def get_stemmer():
+    '''
+    RETURNS the shared English SnowballStemmer
+    '''
+    global _stemmer
+    if _stemmer is None:
+        from nltk.stem.snowball import SnowballStemmer
+        _stemmer = SnowballStemmer("english")
+    return _stemmer
+
+@lru_cache(maxsize=16384)
+def stem(token):
+    '''
+    RETURNS the English stem of the given normalized token
+    INPUT
+        token; lowercase string word without punctuation
+    '''
+    return get_stemmer().stem(token)
+
+def singular(token):
+    '''
+    RETURNS the given normalized token with a regular English plural ending removed
+    INPUT
+        token; lowercase string word without punctuation
+    '''
+    if len(token) > 3 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and re.search(r"(s|x|z|ch|sh)es$", token):
+        return token[:-2]
+    if len(token) > 2 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+def normalize(phrase):
+    '''
+    RETURNS tuple of the phrase's words, lowercased and without non-letter characters
+    INPUT
+        phrase; string keyword or guess
+    '''
+    tokens = [re.sub(r"[^a-z]", "", word) for word in phrase.lower().split()]
+    return tuple(token for token in tokens if token)
+
+def match_signature(phrase):
+    '''
+    RETURNS the MatchSignature of the phrase: its normalized words, their stems, and their singular forms
+    INPUT
+        phrase; string keyword or guess
+    '''
+    tokens = normalize(phrase)
+    forms = frozenset([("words", tokens),
+                       ("stems", tuple(stem(token) for token in tokens)),
+                       ("singular", tuple(singular(token) for token in tokens))])
+    return MatchSignature(tokens, forms)
+
+def matches(guess, signature):
+    '''
+    RETURNS boolean whether the guess matches the keyword with the given signature
+    INPUT
+        guess; string guess
+        signature; MatchSignature of the keyword
+    '''
+    return not match_signature(guess).forms.isdisjoint(signature.forms)